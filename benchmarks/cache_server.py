@@ -0,0 +1,192 @@
+''' Local stand-in for the spacetime cache server.
+
+Speaks the protocol utils.download expects: GET /?q=<url>&u=<useragent>,
+answered with a CBOR map {"url", "status", "response"}, where "response"
+is a pickled requests.Response. Connections are kept alive (HTTP/1.1).
+SyntheticSite serves a crawlable corpus for end-to-end benchmarks.
+'''
+import itertools
+import pickle
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+
+def default_page(url):
+    # (status, content type, body) for url
+    body = f"<html><body><p>Page {url}</p></body></html>".encode("utf-8")
+    return 200, "text/html; charset=utf-8", body
+
+
+class SyntheticSite(object):
+    ''' Deterministic corpus of linked pages over several *.ics.uci.edu hosts,
+    with what makes the real crawl hard:
+
+    * exact duplicates (the previous page, reformatted) and near duplicates
+      (the previous page with a few words changed),
+    * low-value pages with almost no text,
+    * a bounded trap: /archive/<n> links to /archive/<n + 1> up to trap_depth,
+    * links the crawler must filter: calendars, session ids, pdfs, /private/
+      (disallowed by robots.txt),
+    * binary downloads served as application/octet-stream, and 404s.
+
+    Call it with a url for (status, content type, body). '''
+
+    def __init__(self, num_pages=2000, hosts=8, links=10, trap_depth=200, seed=0):
+        self.num_pages = num_pages
+        self.hosts = hosts
+        self.links = links
+        self.trap_depth = trap_depth
+        self.seed = seed
+        rng = random.Random(seed)
+        syllables = ["ka", "lo", "mi", "ren", "sto", "va", "qui", "den", "tor", "ul", "es", "bri"]
+        vocabulary = set()
+        while len(vocabulary) < 5000:
+            vocabulary.add("".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))))
+        self.vocabulary = sorted(vocabulary)
+        # Zipf-like word frequencies
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(self.vocabulary) + 1)))
+
+    def host(self, page_id):
+        return f"host{page_id % self.hosts}.ics.uci.edu"
+
+    def page_url(self, page_id):
+        return f"https://{self.host(page_id)}/page/{page_id}"
+
+    @property
+    def seeds(self):
+        return [self.page_url(page_id) for page_id in range(self.hosts)]
+
+    def _rng(self, page_id):
+        return random.Random(self.seed * 1000003 + page_id)
+
+    def _words(self, rng, count):
+        return rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=count)
+
+    def _article(self, page_id):
+        # (words, links) of a regular page
+        rng = self._rng(page_id)
+        words = self._words(rng, rng.randint(300, 800))
+        links = [self.page_url(rng.randrange(self.num_pages)) for _ in range(self.links)]
+        host = self.host(page_id)
+        roll = rng.random()
+        if roll < 0.05:
+            links.append(self.page_url(self.num_pages + rng.randrange(1000)))
+        elif roll < 0.10:
+            links.append(f"https://{host}/archive/0")
+        elif roll < 0.15:
+            links.append(f"https://{host}/calendar/2024/{rng.randint(1, 12)}/{rng.randint(1, 28)}")
+        elif roll < 0.20:
+            links.append(f"https://{host}/page/{page_id}?sessionid={rng.getrandbits(32):x}")
+        elif roll < 0.25:
+            links.append(f"https://{host}/files/report{page_id}.pdf")
+        elif roll < 0.30:
+            links.append(f"https://{host}/private/{page_id}")
+        elif roll < 0.35:
+            links.append(f"https://{host}/download/{page_id}")
+        return words, links
+
+    @staticmethod
+    def _html(title, words, links, separator=" "):
+        anchors = "".join(f'<li><a href="{link}">link</a></li>' for link in links)
+        paragraphs = "".join(
+            f"<p>{separator.join(words[i:i + 50])}</p>" for i in range(0, len(words), 50))
+        return (
+            f"<html><head><title>{title}</title><script>var x = 1;</script></head>"
+            f"<body><h1>{title}</h1>{paragraphs}<ul>{anchors}</ul></body></html>"
+        ).encode("utf-8")
+
+    def __call__(self, url):
+        parsed = urlparse(url)
+        path = parsed.path.rstrip("/")
+        html = "text/html; charset=utf-8"
+        if path == "/robots.txt":
+            return 200, "text/plain", b"User-agent: *\nDisallow: /private/\n"
+        if path.startswith("/download/"):
+            return 200, "application/octet-stream", random.Random(url).randbytes(20000)
+        if path.startswith("/archive/"):
+            depth = int(path.rsplit("/", 1)[1])
+            words = self._words(self._rng(-depth), 200)
+            links = [] if depth >= self.trap_depth else [
+                f"https://{parsed.netloc}/archive/{depth + 1}"]
+            return 200, html, self._html(f"Archive {depth}", words, links)
+        if not path.startswith("/page/") or parsed.query:
+            return 404, html, b"<html><body>Not found</body></html>"
+        page_id = int(path.rsplit("/", 1)[1])
+        if page_id >= self.num_pages or parsed.netloc != self.host(page_id):
+            return 404, html, b"<html><body>Not found</body></html>"
+
+        kind = page_id % 20
+        if kind == 10 and page_id > 0:
+            # Exact duplicate of the previous page, up to whitespace
+            words, links = self._article(page_id - 1)
+            return 200, html, self._html(f"Page {page_id - 1}", words, links, "  ")
+        if kind == 15:
+            # Near duplicate of the previous page
+            words, links = self._article(page_id - 1)
+            rng = self._rng(page_id)
+            for i in rng.sample(range(len(words)), 5):
+                words[i] = rng.choice(self.vocabulary)
+            return 200, html, self._html(f"Page {page_id}", words, links)
+        words, links = self._article(page_id)
+        if kind == 19:
+            # Low-value page: a handful of words
+            words = words[:20]
+        return 200, html, self._html(f"Page {page_id}", words, links)
+
+
+def encode_response(url, status, content_type, body):
+    raw = requests.Response()
+    raw.status_code = status
+    raw.url = url
+    raw.headers["Content-Type"] = content_type
+    raw.encoding = "utf-8"
+    raw._content = body
+    return cbor.dumps({
+        "url": url, "status": status, "response": pickle.dumps(raw)})
+
+
+class CacheServerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; avoid delayed-ACK stalls.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        url = query.get("q", [""])[0]
+        self.server.requests_served += 1
+        payload = encode_response(url, *self.server.pages(url))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CacheServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The asyncio engine opens many connections at once; a short listen
+    # backlog drops them into SYN retries that stall the crawl for seconds.
+    request_queue_size = 1024
+
+    def __init__(self, pages=default_page, host="127.0.0.1", port=0):
+        super().__init__((host, port), CacheServerHandler)
+        self.pages = pages
+        self.requests_served = 0
+
+    @property
+    def address(self):
+        # (host, port), as expected in config.cache_server
+        return self.server_address[:2]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
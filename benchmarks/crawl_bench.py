@@ -0,0 +1,136 @@
+''' End-to-end crawl throughput against a local stand-in cache server.
+
+Serves a SyntheticSite (duplicates, traps, filtered links, binaries) from
+this process and crawls it once per configuration, each time in a fresh
+subprocess with its own working directory, so save files, CPU time and peak
+memory do not carry over between runs. Cache server registration is
+skipped and robots.txt is fetched through the cache server too. A run ends
+when the crawler does, with nothing left to download.
+
+Run from the repository root:
+    python -m benchmarks.crawl_bench [--pages 2000] [--threads 1,4,8]
+        [--engines threads,asyncio] [--parsers stream] [--stores sqlite]
+'''
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, SUPPRESS
+from configparser import ConfigParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_crawl(options):
+    # Runs in the child process, with the benchmark directory as cwd.
+    from benchmarks.cache_server import SyntheticSite
+    from utils.config import Config
+    from utils.download import download
+    from utils.metrics import PAGES
+    from robots import get_robot_cache
+    from crawler import Crawler
+    from crawler.aio import AsyncCrawler
+    import crawlerstats
+
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    site = SyntheticSite(options["pages"], options["hosts"])
+    overrides = {
+        "CRAWLER": {
+            "SEEDURL": ",".join(site.seeds),
+            "POLITENESS": str(options["politeness"]),
+            "PARSER": options["parser"]},
+        "LOCAL PROPERTIES": {
+            "SAVE": f"frontier.{options['store']}",
+            "STORE": options["store"],
+            "THREADCOUNT": str(options["threads"]),
+            "ENGINE": options["engine"],
+            "METRICSINTERVAL": "0"},
+    }
+    for section, values in overrides.items():
+        cparser[section].update(values)
+    config = Config(cparser)
+    config.cache_server = tuple(options["cache_server"])
+
+    def fetch_robots(robots_url, timeout):
+        resp = download(robots_url, config)
+        if resp.status != 200 or not resp.raw_response:
+            raise OSError(f"robots.txt status {resp.status}")
+        return resp.raw_response.content.decode("utf-8").splitlines()
+    get_robot_cache().fetch = fetch_robots
+
+    start = time.perf_counter()
+    # Not launch.ENGINES: launch imports the spacetime registration.
+    engines = {"threads": Crawler, "asyncio": AsyncCrawler}
+    engines[config.engine](config, True).start()
+    elapsed = time.perf_counter() - start
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    stats = crawlerstats.snapshot()
+    return {
+        "downloaded": PAGES.total(),
+        "crawled": stats.pages_crawled,
+        "seconds": elapsed,
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        # Linux reports kilobytes
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+    }
+
+
+def bench(options):
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        child = subprocess.run(
+            [sys.executable, "-m", "benchmarks.crawl_bench", "--child", json.dumps(options)],
+            cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            check=True)
+    # Last line of the child's output is the result
+    return json.loads(child.stdout.decode("utf-8").strip().splitlines()[-1])
+
+
+def main(args):
+    from benchmarks.cache_server import CacheServer, SyntheticSite
+
+    server = CacheServer(SyntheticSite(args.pages, args.hosts)).start()
+    print(
+        f"{args.pages} pages on {args.hosts} hosts, politeness {args.politeness}s")
+    print(
+        f"{'engine':<8} {'threads':>7} {'parser':<11} {'store':<7} "
+        f"{'urls':>6} {'pages':>6} {'urls/sec':>9} {'CPU ms/url':>10} {'peak RSS':>9}")
+    for engine, threads, parser, store in itertools.product(
+            args.engines.split(","), [int(t) for t in args.threads.split(",")],
+            args.parsers.split(","), args.stores.split(",")):
+        server.requests_served = 0
+        result = bench({
+            "pages": args.pages, "hosts": args.hosts, "politeness": args.politeness,
+            "engine": engine, "threads": threads,
+            "parser": parser, "store": store, "cache_server": server.address})
+        downloaded = max(result["downloaded"], 1)
+        print(
+            f"{engine:<8} {threads:>7} {parser:<11} {store:<7} "
+            f"{result['downloaded']:>6} {result['crawled']:>6} "
+            f"{result['downloaded'] / result['seconds']:>9,.1f} "
+            f"{result['cpu_seconds'] * 1000 / downloaded:>10.2f} "
+            f"{result['peak_rss_mb']:>6.1f} MB")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--hosts", type=int, default=8)
+    parser.add_argument("--politeness", type=float, default=0.0)
+    parser.add_argument("--threads", default="1,4,8")
+    parser.add_argument("--engines", default="threads,asyncio")
+    parser.add_argument("--parsers", default="stream")
+    parser.add_argument("--stores", default="sqlite")
+    parser.add_argument("--child", default=None, help=SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(run_crawl(json.loads(args.child))))
+    else:
+        main(args)
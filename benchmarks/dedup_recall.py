@@ -0,0 +1,151 @@
+''' Recall of the MinHash/LSH near-duplicate index against exact Jaccard.
+
+Pages are checked in order, as the workers do. For every page the index's
+answer is compared with the exact method it replaced: Jaccard similarity
+of the token sets against every page the index kept so far, a duplicate
+at >= threshold. Both see the same kept pages, so every page is a fair
+comparison. Recall is reported overall and by the best exact similarity,
+next to the false positive rate: the fraction of the pages the exact
+method keeps that the index drops.
+
+The corpus is either a page store recorded with PAGESTOREMODE = record
+(--store), tokenized like the workers do, or by default synthetic pages
+with near duplicates spread evenly over Jaccard 0.75 to 1.
+
+Exits with status 1 if the recall is below --min-recall, or the false
+positive rate above --max-false-positive-rate.
+
+Run from the repository root:
+    python -m benchmarks.dedup_recall [--store pages.store] [--min-recall 0.9]
+        [--max-false-positive-rate 0.1]
+'''
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+from dedup import NearDuplicateIndex
+
+# Lower bounds of the similarity ranges recall is reported for
+RANGES = (0.85, 0.88, 0.9, 0.95)
+
+
+def synthetic_corpus(bases, variants, seed=0):
+    # Token lists: bases random pages, then variants near duplicates of
+    # them with a target Jaccard similarity drawn from [0.75, 1].
+    from benchmarks.cache_server import SyntheticSite
+
+    site = SyntheticSite(seed=seed)
+    rng = random.Random(seed)
+    pages = [sorted(set(site._words(site._rng(page_id), 600))) for page_id in range(bases)]
+    fresh = 0
+    for _ in range(variants):
+        tokens = list(pages[rng.randrange(bases)])
+        target = rng.uniform(0.75, 1.0)
+        # Replacing r of m distinct tokens gives J = (m - r) / (m + r).
+        replaced = round(len(tokens) * (1 - target) / (1 + target))
+        for i in rng.sample(range(len(tokens)), replaced):
+            tokens[i] = f"fresh{fresh}"
+            fresh += 1
+        pages.append(tokens)
+    rng.shuffle(pages)
+    return pages
+
+
+def recorded_corpus(directory):
+    # Token lists of the kept-size pages of a recorded page store.
+    from utils.pagestore import PageStore
+    from utils.download import to_response
+    from pageparser import parse_page
+    from tokenizer import tokenize_and_count
+
+    store = PageStore(directory)
+    pages = []
+    for segment, offset in sorted(store.index.values()):
+        record = store._read(segment, offset)
+        if record is None or record[1] != 200:
+            continue
+        resp = to_response(record[0], record[1], record[2], 0.0)
+        if not resp.raw_response or not resp.raw_response.content:
+            continue
+        page = parse_page(record[0], resp.raw_response.content)
+        token_count, freq_map = tokenize_and_count(page.text)
+        # The workers' low-value filter
+        if token_count < 100 or len(freq_map) / token_count < 0.2:
+            continue
+        pages.append(list(freq_map))
+    store.close()
+    return pages
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+def compare(pages, threshold):
+    index = NearDuplicateIndex(threshold=threshold)
+    kept = []
+    # best exact similarity -> [exact duplicates, found by the index]
+    found = {low: [0, 0] for low in RANGES}
+    # Pages the exact method keeps, and those the index drops anyway
+    distinct = false_positives = 0
+    index_seconds = 0.0
+    for tokens in pages:
+        token_set = set(tokens)
+        best = max((jaccard(token_set, other) for other in kept), default=0.0)
+        start = time.perf_counter()
+        duplicate = index.query_and_insert(tokens)
+        index_seconds += time.perf_counter() - start
+        if best >= threshold:
+            low = max((low for low in RANGES if low <= best), default=RANGES[0])
+            found[low][0] += 1
+            found[low][1] += duplicate
+        else:
+            distinct += 1
+            false_positives += duplicate
+        if not duplicate:
+            kept.append(token_set)
+    return index, found, (distinct, false_positives), index_seconds
+
+
+def main(args):
+    if args.store:
+        pages = recorded_corpus(args.store)
+        print(f"{len(pages)} pages recorded in {args.store}")
+    else:
+        pages = synthetic_corpus(args.bases, args.variants)
+        print(f"{len(pages)} synthetic pages, {args.variants} near duplicates")
+
+    index, found, (distinct, false_positives), index_seconds = compare(
+        pages, args.threshold)
+    print(
+        f"threshold {args.threshold}, {index.bands} bands x {index.rows} rows, "
+        f"{index_seconds * 1000 / max(len(pages), 1):.2f} ms per page")
+    bounds = RANGES[1:] + (1.0,)
+    for (low, (exact, both)), high in zip(found.items(), bounds):
+        if exact:
+            print(f"  exact J in [{low:.2f}, {high:.2f}{']' if high == 1.0 else ')'}: "
+                  f"{both}/{exact} found, recall {both / exact:.1%}")
+    exact = sum(counts[0] for counts in found.values())
+    both = sum(counts[1] for counts in found.values())
+    recall = both / exact if exact else 1.0
+    false_positive_rate = false_positives / distinct if distinct else 0.0
+    print(f"recall {both}/{exact} = {recall:.1%}")
+    print(
+        f"false positive rate {false_positives}/{distinct} = "
+        f"{false_positive_rate:.1%}")
+    passed = (
+        recall >= args.min_recall
+        and false_positive_rate <= args.max_false_positive_rate)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--store", default=None, help="recorded page store directory")
+    parser.add_argument("--bases", type=int, default=300)
+    parser.add_argument("--variants", type=int, default=700)
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--max-false-positive-rate", type=float, default=0.1)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,70 @@
+''' Download throughput and latency against a local stand-in cache server,
+one request per new connection (as before) versus utils.download.
+
+Run from the repository root:
+    python -m benchmarks.download_bench [--requests 2000] [--threads 4]
+'''
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import cbor
+import requests
+
+from benchmarks.cache_server import CacheServer
+from utils.download import download
+from utils.response import Response
+
+
+class BenchConfig(object):
+    user_agent = "IR benchmark"
+    connect_timeout = 5
+    read_timeout = 30
+    download_retries = 3
+    download_backoff = 0.5
+
+    def __init__(self, cache_server):
+        self.cache_server = cache_server
+
+
+def download_unpooled(url, config):
+    # What utils.download did before: a bare requests.get per page.
+    host, port = config.cache_server
+    start = time.perf_counter()
+    resp = requests.get(
+        f"http://{host}:{port}/",
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    return Response(cbor.loads(resp.content), time.perf_counter() - start)
+
+
+def bench(name, func, config, num_requests, threads):
+    urls = [f"https://www.ics.uci.edu/page/{i}" for i in range(num_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        responses = list(executor.map(lambda url: func(url, config), urls))
+    elapsed = time.perf_counter() - start
+    assert all(resp.status == 200 for resp in responses)
+
+    latencies = sorted(resp.latency for resp in responses)
+    mean = sum(latencies) / len(latencies)
+    p95 = latencies[int(len(latencies) * 0.95)]
+    print(
+        f"{name:<12} {num_requests / elapsed:>10,.0f} requests/sec, "
+        f"latency mean {mean * 1000:.2f} ms, p95 {p95 * 1000:.2f} ms")
+
+
+def main(num_requests, threads):
+    server = CacheServer().start()
+    config = BenchConfig(server.address)
+    print(f"{num_requests} requests, {threads} threads")
+    bench("unpooled", download_unpooled, config, num_requests, threads)
+    bench("pooled", download, config, num_requests, threads)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    main(args.requests, args.threads)
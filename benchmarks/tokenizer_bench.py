@@ -0,0 +1,67 @@
+''' Tokenizer throughput on large synthetic pages.
+
+Run from the repository root:
+    python -m benchmarks.tokenizer_bench [--pages 20] [--size 200000]
+'''
+import random
+import time
+from argparse import ArgumentParser
+
+from tokenizer import (
+    tokenize, tokenize_segmented, iter_tokens, tokenize_and_count,
+    computeWordFrequencies)
+
+WORDS = [
+    "research", "faculty", "students", "computer", "science", "informatics",
+    "statistics", "machine", "learning", "don't", "uci", "2024", "CS121",
+    "Irvine", "café", "naïve", "graduate", "undergraduate", "seminar", "lab"]
+PUNCTUATION = [" ", " ", " ", ", ", ". ", "\n", " - ", " (", ") ", "/", ": "]
+
+
+def synthetic_page(size, rng):
+    parts = []
+    length = 0
+    while length < size:
+        part = rng.choice(WORDS) + rng.choice(PUNCTUATION)
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def bench(name, func, pages):
+    start = time.perf_counter()
+    tokens = sum(func(page) for page in pages)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {tokens / elapsed:>14,.0f} tokens/sec")
+    return tokens
+
+
+def main(num_pages, size):
+    rng = random.Random(0)
+    mixed = [synthetic_page(size, rng) for _ in range(num_pages)]
+    ascii_only = [page.encode("ascii", "ignore").decode() for page in mixed]
+
+    for label, pages in (("ASCII", ascii_only), ("non-ASCII", mixed)):
+        for page in pages:
+            assert tokenize(page) == tokenize_segmented(page)
+
+        print(f"{num_pages} {label} pages of {size:,} characters")
+        bench(
+            "tokenize_segmented + computeWordFrequencies",
+            lambda page: sum(computeWordFrequencies(tokenize_segmented(page)).values()),
+            pages)
+        bench(
+            "tokenize + computeWordFrequencies",
+            lambda page: sum(computeWordFrequencies(tokenize(page)).values()),
+            pages)
+        bench("iter_tokens", lambda page: sum(1 for _ in iter_tokens(page)), pages)
+        bench("tokenize_and_count", lambda page: tokenize_and_count(page)[0], pages)
+        print()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--size", type=int, default=200000)
+    args = parser.parse_args()
+    main(args.pages, args.size)
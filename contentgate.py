@@ -0,0 +1,73 @@
+from collections import Counter
+from threading import Lock
+
+# Checks made on a downloaded page before any parsing or tokenizing.
+# Each check is cheaper than the next: the payload size needs no decoding,
+# the Content-Type needs the unpickled response, the sniff reads its body.
+
+# Bytes found in text: printable, whitespace, and a few control characters
+TEXT_BYTES = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+# Bytes of the body sniffed for binary content
+SNIFF_SIZE = 1024
+# Fraction of non-text bytes above which a body is binary
+BINARY_RATIO = 0.3
+
+
+def looks_binary(sample):
+    if not sample:
+        return False
+    if b"\x00" in sample:
+        return True
+    return len(sample.translate(None, TEXT_BYTES)) / len(sample) > BINARY_RATIO
+
+
+class ContentGate(object):
+    ''' Rejects pages not worth parsing: larger than max_size bytes, with a
+    Content-Type outside content_types, empty, or binary. rejections counts
+    the pages each check rejected. '''
+
+    def __init__(self, max_size=10 * 1024 * 1024,
+                 content_types=("text/html", "application/xhtml+xml", "text/plain")):
+        self.max_size = max_size
+        self.content_types = frozenset(content_types)
+        self.lock = Lock()
+        self.rejections = Counter()
+
+    def rejecting_check(self, resp):
+        # Name of the check rejecting resp, a 200 response, or None.
+        check = self._check(resp)
+        if check:
+            with self.lock:
+                self.rejections[check] += 1
+        return check
+
+    def _check(self, resp):
+        if resp.payload_size > self.max_size:
+            return "too_large"
+        raw_response = resp.raw_response
+        if raw_response is None or not raw_response.content:
+            return "empty"
+        content_type = raw_response.headers.get("Content-Type", "")
+        mime_type = content_type.split(";", 1)[0].strip().lower()
+        # Pages without a Content-Type are left to the sniff
+        if mime_type and mime_type not in self.content_types:
+            return "content_type"
+        if looks_binary(raw_response.content[:SNIFF_SIZE]):
+            return "binary"
+        return None
+
+    def stats(self):
+        with self.lock:
+            rejections = ", ".join(
+                f"{check} {count}" for check, count in self.rejections.most_common())
+        return f"rejections: {rejections or 'none'}"
+
+
+content_gate = ContentGate()
+
+def get_content_gate():
+    return content_gate
+
+def configure_content_gate(config):
+    content_gate.max_size = int(config.max_page_size * 1024 * 1024)
+    content_gate.content_types = frozenset(config.content_types)
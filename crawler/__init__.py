@@ -1,16 +1,34 @@
 from utils import get_logger
 from crawler.frontier import Frontier
-from crawler.worker import Worker
+from crawler.worker import Worker, configure_dedup
+from crawler.checkpoint import Checkpointer
+from urlfilter import get_url_filter
+from robots import configure_robot_cache, get_robot_cache
+from contentgate import get_content_gate, configure_content_gate
+from crawlerstats import configure_stats
+from utils.metrics import start_metrics
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        configure_robot_cache(config)
+        configure_content_gate(config)
+        configure_stats(config)
+        configure_dedup(config)
         self.frontier = frontier_factory(config, restart)
+        self.checkpointer = Checkpointer(config, self.frontier.resumed)
         self.workers = list()
         self.worker_factory = worker_factory
 
     def start_async(self):
+        self.start_workers()
+        self.checkpointer.start()
+        start_metrics(self.config)
+
+    def start_workers(self):
+        # Engines override start_workers and join_workers; the rest of the
+        # setup and teardown is shared.
         self.workers = [
             self.worker_factory(worker_id, self.config, self.frontier)
             for worker_id in range(self.config.threads_count)]
@@ -22,5 +40,13 @@ class Crawler(object):
         self.join()
 
     def join(self):
+        self.join_workers()
+        self.checkpointer.close()
+        self.frontier.close()
+        get_robot_cache().save()
+        self.logger.info(f"URL filter: {get_url_filter().stats()}.")
+        self.logger.info(f"Content gate: {get_content_gate().stats()}.")
+
+    def join_workers(self):
         for worker in self.workers:
             worker.join()
@@ -0,0 +1,86 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from utils import get_logger, SAMPLED
+from utils.async_download import AsyncCacheClient
+from crawler import Crawler
+from crawler.frontier import Frontier
+from crawler.worker import process_page, mark_complete
+from utils.metrics import time_stage
+
+
+class AsyncCrawler(Crawler):
+    ''' Crawler engine running all downloads on one asyncio event loop.
+
+    Up to config.max_in_flight downloads are in flight at once. The
+    frontier is polled without blocking, so its per-host politeness
+    applies as with the thread engine. Parsing, tokenizing and the rest of
+    process_page run on a pool of config.threads_count threads. '''
+
+    def __init__(self, config, restart, frontier_factory=Frontier):
+        super().__init__(config, restart, frontier_factory)
+        self.worker_logger = get_logger("Worker-async", "Worker")
+        self.loop_thread = None
+
+    def start_workers(self):
+        self.loop_thread = Thread(
+            target=lambda: asyncio.run(self._crawl()), daemon=True)
+        self.loop_thread.start()
+
+    def join_workers(self):
+        self.loop_thread.join()
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(self.config.threads_count)
+        client = AsyncCacheClient(self.config, self.config.max_in_flight)
+        slots = asyncio.Semaphore(self.config.max_in_flight)
+        tasks = set()
+
+        try:
+            while True:
+                tbd_url, wait = self.frontier.poll_tbd_url()
+                if tbd_url:
+                    await slots.acquire()
+                    task = asyncio.create_task(
+                        self._fetch(tbd_url, client, executor, loop))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    task.add_done_callback(lambda _: slots.release())
+                elif wait is not None:
+                    # Earliest host is not ready yet.
+                    await asyncio.sleep(wait)
+                elif self.frontier.finished():
+                    # Stopped, or nothing left: finish the pages in flight.
+                    if tasks:
+                        await asyncio.wait(list(tasks))
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+                elif tasks:
+                    # Frontier is empty until in-flight pages add links.
+                    await asyncio.wait(
+                        list(tasks), return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    # Waiting for a lazy resume, or for other shards.
+                    await asyncio.sleep(0.5)
+        finally:
+            client.close()
+            executor.shutdown(wait=True)
+
+    async def _fetch(self, tbd_url, client, executor, loop):
+        logger = self.worker_logger
+        try:
+            with time_stage("download"):
+                resp = await client.download(tbd_url, logger)
+            logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server} "
+                f"in {resp.latency:.3f}s.", extra=SAMPLED)
+            await loop.run_in_executor(
+                executor, process_page,
+                tbd_url, resp, self.config, self.frontier, logger)
+        except Exception:
+            # Completed anyway, or the crawl would wait for it forever.
+            logger.exception(f"Failed to process {tbd_url}.")
+            mark_complete(self.frontier, tbd_url, "error")
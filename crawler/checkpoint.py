@@ -0,0 +1,100 @@
+import atexit
+import os
+import pickle
+import zlib
+from threading import Thread, Event, Lock
+
+from utils import get_logger
+from crawlerstats import snapshot, restore_stats
+from utils.urlcanon import url_fingerprint
+from crawler import worker
+
+# Version 2 keeps unique urls as fingerprints instead of strings.
+CHECKPOINT_VERSION = 2
+
+
+class Checkpointer(object):
+    ''' Periodic snapshots of the crawl statistics and of the duplicate
+    detection indexes, so a resumed crawl reports the whole crawl.
+
+    Every config.checkpoint_interval seconds a background thread copies the
+    state, then pickles, compresses and writes it to config.stats_file
+    (atomically, through a temporary file). Workers only wait for the
+    copies. A last checkpoint is written on close and at exit. Pages
+    processed after the last checkpoint of a crashed run are missing from
+    the statistics, or counted twice if they are crawled again. '''
+
+    def __init__(self, config, resume):
+        # resume: whether the frontier resumed from its save file. Otherwise
+        # the checkpoint belongs to another crawl and is deleted.
+        self.stats_file = config.stats_file
+        self.interval = config.checkpoint_interval
+        self.logger = get_logger("CHECKPOINT")
+        self.save_lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+        if resume:
+            self.load()
+        elif os.path.exists(self.stats_file):
+            self.logger.info(f"Not resuming a crawl, deleting {self.stats_file}.")
+            os.remove(self.stats_file)
+        atexit.register(self.close)
+
+    def start(self):
+        if self.interval > 0 and self.thread is None:
+            self.thread = Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.save()
+            except Exception:
+                self.logger.exception(f"Could not write {self.stats_file}.")
+
+    def load(self):
+        if not os.path.exists(self.stats_file):
+            return
+        try:
+            with open(self.stats_file, "rb") as f:
+                state = pickle.loads(zlib.decompress(f.read()))
+            if state.get("version") not in (1, CHECKPOINT_VERSION):
+                raise ValueError(f"unknown version {state.get('version')}")
+            worker.unique_pages.load_state(state["near_duplicates"])
+            worker.unique_contents.load_state(state["contents"])
+        except (OSError, EOFError, ValueError, KeyError,
+                zlib.error, pickle.UnpicklingError) as e:
+            self.logger.error(f"Could not load {self.stats_file}: {e}")
+            return
+        if state["version"] == 1 and isinstance(state["stats"].unique_urls, set):
+            state["stats"].unique_urls = {
+                url_fingerprint(url) for url in state["stats"].unique_urls}
+        restore_stats(state["stats"])
+        self.logger.info(
+            f"Loaded statistics of {state['stats'].pages_crawled} pages "
+            f"from {self.stats_file}.")
+
+    def save(self):
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "stats": snapshot(),
+            "near_duplicates": worker.unique_pages.export_state(),
+            "contents": worker.unique_contents.export_state(),
+        }
+        data = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+        with self.save_lock:
+            tmp_file = f"{self.stats_file}.tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.stats_file)
+
+    def close(self):
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.save()
@@ -1,13 +1,44 @@
-import os
-import shelve
+import heapq
 
-from threading import Thread, RLock
+from threading import Thread, RLock, Condition
 import time
+from itertools import count
 from urllib.parse import urlparse
-from queue import Queue, Empty
 
-from utils import get_logger, get_urlhash, normalize
+from utils import get_logger
+from utils.urlcanon import canonicalize, url_fingerprint, cache_stats
 from scraper import is_valid
+from robots import get_robot_cache
+from crawler.store import open_store, remove_store, store_exists, ShelveStore
+from crawler.seen import make_seen_filter
+from utils.metrics import register_gauge
+
+# Score of a url, lower is fetched first: its link depth from the seeds,
+# plus path_penalty. A host's priority adds up to YIELD_WEIGHT for a low
+# yield of kept pages.
+YIELD_WEIGHT = 4
+# The yield is measured over a host's recent pages: its counts of kept and
+# discarded pages decay by this factor at each finished page.
+YIELD_DECAY = 0.95
+# Path segments beyond this many count as a penalty
+DEEP_PATH = 6
+# Penalty per repeated path segment, e.g. /a/b/a/b
+REPEAT_WEIGHT = 2
+
+
+def path_penalty(url):
+    # Signals of generated subtrees: repeated and very deep path segments.
+    segments = [segment for segment in urlparse(url).path.lower().split("/") if segment]
+    repeated = len(segments) - len(set(segments))
+    return REPEAT_WEIGHT * repeated + max(0, len(segments) - DEEP_PATH)
+
+
+def budget_area(url):
+    # Budgets are per host and first path segment, so a trap such as a
+    # calendar runs out without holding back the rest of its host.
+    parsed = urlparse(url)
+    return parsed.netloc, parsed.path.lstrip("/").split("/", 1)[0]
+
 
 class Frontier(object):
     def __init__(self, config, restart):
@@ -15,97 +46,369 @@ class Frontier(object):
         self.config = config
 
         self.lock = RLock()
-        self.domain_last_access = {}
-        self.politeness_delay = 0.5
-
-        # Queue implementation
-        #self.to_be_downloaded = list()
-        self.to_be_downloaded = Queue()
-        
-        if not os.path.exists(self.config.save_file) and not restart:
+        self.host_ready = Condition(self.lock)
+
+        # Host-aware, scored scheduler
+        # host_queues: per-host heap of (score, seq, url, depth), lowest score first
+        # waiting_heap: (next allowed fetch time, host) for scheduled hosts
+        # ready_hosts: (host priority, seq, host) for hosts that may be fetched now
+        # Every host with queued urls is in exactly one of the two heaps.
+        # deferred: budget area -> its entries, while it is over its budget
+        # domain_next_access: earliest time each host may be fetched again
+        self.host_queues = {}
+        self.waiting_heap = []
+        self.ready_hosts = []
+        self.deferred = {}
+        self.domain_next_access = {}
+        self.seq = count()
+        # host -> [recent pages kept, recent pages discarded], decayed
+        self.host_stats = {}
+        # budget area -> fetches left, see _over_budget
+        self.budgets = {}
+        # Urls handed out and not completed yet, with their link depth
+        self.in_flight = {}
+        # The crawl ends when stopped, e.g. at MAXPAGES or MAXTIME, or when
+        # nothing is queued or in flight.
+        self.stopped = False
+        self.pages = 0
+        self.deadline = time.time() + config.max_time if config.max_time else None
+        # How long an idle get_tbd_url waits before checking again, None
+        # when every change it waits for notifies host_ready.
+        self.idle_wait = None
+
+        if not store_exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif store_exists(self.config.save_file) and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            remove_store(self.config.save_file)
         # Load existing save file, or create one if it does not exist.
-        # self.save = shelve.open(self.config.save_file, flag='c', protocol=None, writeback=False)
+        # One handle is kept open for the whole crawl.
+        self.save = open_store(self.config)
+        if self.config.store != "shelve" and isinstance(self.save, ShelveStore):
+            self.logger.warning(
+                f"Save file {self.config.save_file} is a dbm file, opening it "
+                f"with the shelve store instead of {self.config.store}.")
+        if self.save.migrated:
+            self.logger.info(
+                f"Migrated {self.save.migrated} urls of {self.config.save_file} "
+                f"to url fingerprint keys.")
         self.db_lock = RLock()
-        if restart:
-            for url in self.config.seed_urls:
-                self.add_url(url)
+        # Every url ever added, so repeated links never reach the save file.
+        self.seen = make_seen_filter(self.config)
+        # False while a lazy resume is still streaming in the save file.
+        self.loaded = True
+        # Whether the crawl continues from an existing save file; the
+        # statistics checkpoint is only loaded if it does.
+        self.resumed = not restart and len(self.save) > 0
+        if not self.resumed:
+            self.add_urls(self.config.seed_urls, valid=None)
         else:
             # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            with shelve.open(self.config.save_file) as save:
-                if not save:
-                    for url in self.config.seed_urls:
-                        self.add_url(url)
+            if self.config.lazy_resume:
+                # Start downloading right away, the rest streams in.
+                # The crawl cannot end before loading does.
+                self.loaded = False
+                Thread(target=self._parse_save_file, daemon=True).start()
+            else:
+                self._parse_save_file()
+
+        register_gauge(
+            "crawler_frontier_size", "Urls waiting to be downloaded.",
+            lambda: sum(self.queue_depths().values()))
+        register_gauge(
+            "crawler_frontier_hosts", "Hosts with urls waiting to be downloaded.",
+            lambda: len(self.host_queues))
+        register_gauge(
+            "crawler_host_queue_depth", "Urls waiting to be downloaded, per host.",
+            self.queue_depths, "host")
+        register_gauge(
+            "crawler_deferred_areas",
+            "Host and path areas with urls waiting, but over their budget.",
+            lambda: len(self.deferred))
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
-        # total_count = len(self.save)
-        total_count = 0
+        # Only the pending urls are read. is_valid runs just for urls
+        # whose decision was never cached, or for all of them if
+        # REVALIDATE is set (e.g. after changing the scraper rules).
+        fps = self.save.keys()
+        total_count = len(fps)
+        for start in range(0, total_count, 10000):
+            with self.db_lock:
+                self.seen.update(fps[start:start + 10000])
+        del fps
+
         tbd_count = 0
-        with shelve.open(self.config.save_file) as save:
-            total_count = len(save)
-            for url, completed in save.values():
-                if not completed and is_valid(url):
-                    self.to_be_downloaded.put(url)
-                    tbd_count += 1
+        for fp, url, valid in self.save.pending():
+            if valid is None or self.config.revalidate:
+                valid = is_valid(url)
+                with self.db_lock:
+                    self.save[fp] = (url, False, valid)
+            if valid:
+                self._enqueue(url)
+                tbd_count += 1
+        with self.lock:
+            self.loaded = True
+            self.host_ready.notify_all()
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
+    def _enqueue(self, url, depth=0):
+        area = budget_area(url)
+        entry = (depth + path_penalty(url), next(self.seq), url, depth)
+        with self.lock:
+            deferred = self.deferred.get(area)
+            if deferred is not None:
+                # Waits until its area earns more fetches
+                deferred.append(entry)
+            else:
+                self._push(area[0], entry)
+
+    def _push(self, host, entry):
+        # With self.lock held
+        queue = self.host_queues.get(host)
+        if queue is None:
+            queue = self.host_queues[host] = []
+            # Host becomes schedulable again
+            heapq.heappush(
+                self.waiting_heap, (self.domain_next_access.get(host, 0), host))
+            self.host_ready.notify()
+        heapq.heappush(queue, entry)
+
+    def _host_yield(self, host):
+        # Fraction of the host's recent finished pages that were kept,
+        # smoothed so that new hosts start at 0.5.
+        kept, discarded = self.host_stats.get(host, (0, 0))
+        return (kept + 1) / (kept + discarded + 2)
+
+    def _host_priority(self, host):
+        # Score of the host's best url, plus a penalty for a low yield.
+        return (self.host_queues[host][0][0]
+                + YIELD_WEIGHT * (1 - self._host_yield(host)))
+
+    def _over_budget(self, area):
+        # Each fetch of an area spends one of its host_budget fetches, and
+        # each page it keeps earns host_budget_per_page more, up to
+        # host_budget. Areas that keep producing useless pages run out,
+        # however many pages they kept before.
+        if not self.config.host_budget:
+            return False
+        return self.budgets.get(area, self.config.host_budget) <= 0
+
+    def _defer(self, area, entry):
+        # With self.lock held
+        deferred = self.deferred.get(area)
+        if deferred is None:
+            deferred = self.deferred[area] = []
+            host, segment = area
+            self.logger.info(
+                f"Deferring the urls of {host}/{segment}, over its budget "
+                f"at host yield {self._host_yield(host):.0%}.")
+        deferred.append(entry)
+
+    def _politeness_delay(self, url):
+        # Honour a robots.txt Crawl-delay if it is longer than ours
+        crawl_delay = get_robot_cache().crawl_delay(url)
+        if crawl_delay:
+            return max(self.config.time_delay, float(crawl_delay))
+        return self.config.time_delay
+
+    def _next_url(self):
+        # (url, None) for the best url of the best host ready now, (None,
+        # seconds until the earliest host is ready) if no host is ready,
+        # (None, None) if nothing is queued within budget.
+        # Must be called with self.lock held.
+        now = time.time()
+        while self.waiting_heap and self.waiting_heap[0][0] <= now:
+            _, host = heapq.heappop(self.waiting_heap)
+            heapq.heappush(
+                self.ready_hosts, (self._host_priority(host), next(self.seq), host))
+
+        while self.ready_hosts:
+            _, _, host = heapq.heappop(self.ready_hosts)
+            queue = self.host_queues[host]
+            while queue:
+                entry = heapq.heappop(queue)
+                area = budget_area(entry[2])
+                if not self._over_budget(area):
+                    break
+                self._defer(area, entry)
+            else:
+                # Every queued url of the host was deferred
+                del self.host_queues[host]
+                continue
+
+            _, _, url, depth = entry
+            next_access = now + self._politeness_delay(url)
+            self.domain_next_access[host] = next_access
+            if queue:
+                heapq.heappush(self.waiting_heap, (next_access, host))
+            else:
+                del self.host_queues[host]
+            if self.config.host_budget:
+                self.budgets[area] = self.budgets.get(area, self.config.host_budget) - 1
+            self.in_flight[url] = depth
+            return url, None
+
+        if self.waiting_heap:
+            return None, self.waiting_heap[0][0] - now
+        return None, None
+
     def get_tbd_url(self):
-        try:
-            url = self.to_be_downloaded.get_nowait()
-        except Empty:
-            return None
-        
-        domain = urlparse(url).netloc
-        
+        # Returns a url whose host may be fetched now, waiting (without
+        # holding the lock) until the earliest host is ready, or until
+        # urls in flight add links.
+        # Returns None when the crawl is over: stopped, or nothing left
+        # queued and nothing in flight.
+        with self.lock:
+            while True:
+                if self._should_stop():
+                    return None
+                url, wait = self._next_url()
+                if url:
+                    return url
+                if wait is None:
+                    if self._finished():
+                        return None
+                    wait = self.idle_wait
+                if self.deadline is not None:
+                    wait = max(0, min(
+                        self.deadline - time.time(),
+                        float("inf") if wait is None else wait))
+                self.host_ready.wait(wait)
+
+    def poll_tbd_url(self):
+        # Non-blocking get_tbd_url for event loops, see _next_url. After
+        # (None, None), finished() tells if the crawl is over.
+        with self.lock:
+            if self._should_stop():
+                return None, None
+            return self._next_url()
 
-        with self.lock:     
-            now = time.time()
-            last_access = self.domain_last_access.get(domain, 0)
+    def finished(self):
+        with self.lock:
+            if self._should_stop():
+                return True
+            if self.waiting_heap or self.ready_hosts:
+                return False
+            return self._finished()
 
-            wait_time = self.politeness_delay - (now - last_access)
+    def _should_stop(self):
+        # With self.lock held
+        if self.deadline is not None and not self.stopped and time.time() >= self.deadline:
+            self.stop(f"Crawled for {self.config.max_time:g} seconds")
+        return self.stopped
 
-            if wait_time > 0:
-                time.sleep(wait_time)
-            
-            self.domain_last_access[domain] = time.time()
+    def _finished(self):
+        # With self.lock held and nothing queued: True if nothing can be
+        # queued any more.
+        return self.loaded and not self.in_flight
 
-        return url
+    def stop(self, reason):
+        # Hand out no more urls; pages in flight still complete.
+        with self.lock:
+            if not self.stopped:
+                self.stopped = True
+                self.logger.info(f"{reason}, stopping the crawl.")
+                self.host_ready.notify_all()
 
-    def add_url(self, url):
+    def page_crawled(self):
+        # Counts a kept page towards MAXPAGES.
+        with self.lock:
+            self.pages += 1
+            if self.config.max_pages and self.pages >= self.config.max_pages:
+                self.stop(f"Crawled {self.pages} pages")
 
-        url = normalize(url)
-        urlhash = get_urlhash(url)
+    def queue_depths(self):
+        with self.lock:
+            return {host: len(queue) for host, queue in self.host_queues.items()}
+
+    def add_url(self, url, valid=True, parent=None):
+        # urls normally come from scraper.scraper, which only returns urls
+        # that passed is_valid. valid=None leaves the check to the next resume.
+        # parent is the page url was found on, for its link depth.
+        self.add_urls([url], valid, parent)
+
+    def add_urls(self, urls, valid=True, parent=None):
+        # add_url for every url in urls, e.g. the links of one page, taking
+        # the locks once and writing the new urls in one group commit.
+        # Returns how many urls were new to the frontier.
+        return self._add_urls(
+            dict.fromkeys(map(canonicalize, urls)), valid, self._child_depth(parent))
+
+    def _child_depth(self, parent):
+        if parent is None:
+            return 0
+        with self.lock:
+            return self.in_flight.get(parent, 0) + 1
+
+    def _add_urls(self, urls, valid, depth):
+        # urls are canonical and distinct.
+        fps = [(url_fingerprint(url), url) for url in urls]
 
         # Thread-safe
         with self.db_lock:
-            with shelve.open(self.config.save_file) as save:
-                if urlhash not in save:
-                    save[urlhash] = (url, False)
-                    # self.save.sync()
-                    self.to_be_downloaded.put(url)
-    
-    def mark_url_complete(self, url):
-        urlhash = get_urlhash(url)
+            # While the seen filter is still loading, the save file has
+            # the final say.
+            new = [
+                (fp, url) for fp, url in fps
+                if self.seen.add_if_new(fp) and (self.loaded or fp not in self.save)]
+            if not new:
+                return 0
+            self.save.update((fp, (url, False, valid)) for fp, url in new)
+            with self.lock:
+                for _, url in new:
+                    self._enqueue(url, depth)
+        return len(new)
+
+    def mark_url_complete(self, url, kept=None):
+        # kept: whether the page was worth downloading (not a duplicate,
+        # low-value or error page), feeding its host's yield and its
+        # area's budget.
+        self._record_outcome(url, kept)
+        fp = url_fingerprint(url)
 
         # Thread-safe
         with self.db_lock:
-            with shelve.open(self.config.save_file) as save:
-                if urlhash not in save:
-                    # This should not happen.
-                    self.logger.error(
-                        f"Completed url {url}, but have not seen it before.")
-
-                save[urlhash] = (url, True)
-                # self.save.sync()
+            if self.loaded and fp not in self.seen:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            self.save[fp] = (url, True, True)
+
+    def _record_outcome(self, url, kept):
+        with self.lock:
+            self.in_flight.pop(url, None)
+            if not self.in_flight:
+                # Idle workers check whether the crawl is over.
+                self.host_ready.notify_all()
+            if kept is None:
+                return
+            area = budget_area(url)
+            host = area[0]
+            stats = self.host_stats.setdefault(host, [0.0, 0.0])
+            stats[0] *= YIELD_DECAY
+            stats[1] *= YIELD_DECAY
+            stats[0 if kept else 1] += 1
+            if not kept or not self.config.host_budget:
+                return
+            self.budgets[area] = min(
+                self.config.host_budget,
+                self.budgets.get(area, self.config.host_budget)
+                + self.config.host_budget_per_page)
+            if area in self.deferred and not self._over_budget(area):
+                # Kept pages earned the area more fetches.
+                for entry in self.deferred.pop(area):
+                    self._push(host, entry)
+
+    def close(self):
+        # Commit pending writes and release the save file.
+        self.logger.info(f"Seen filter: {self.seen.stats()}; {cache_stats()}.")
+        self.save.close()
@@ -0,0 +1,114 @@
+import math
+
+
+def _mix(x):
+    # splitmix64 finalizer, used to derive a second independent hash.
+    x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9 & 0xFFFFFFFFFFFFFFFF
+    x = (x ^ (x >> 27)) * 0x94d049bb133111eb & 0xFFFFFFFFFFFFFFFF
+    return x ^ (x >> 31)
+
+
+class SeenFilter(object):
+    ''' In-memory membership test in front of the frontier store.
+
+    Holds utils.urlcanon.url_fingerprint values. add_if_new returns True
+    for fingerprints that have not been seen and records them, so duplicate
+    links are rejected without touching disk. hits counts rejected
+    duplicates and misses counts new urls. '''
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def add_if_new(self, fp):
+        if fp in self:
+            self.hits += 1
+            return False
+        self.misses += 1
+        self.add(fp)
+        return True
+
+    def update(self, fps):
+        for fp in fps:
+            self.add(fp)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return (
+            f"{self.hits} duplicate hits, {self.misses} misses, "
+            f"hit rate {self.hit_rate():.1%}")
+
+
+class ExactSeenFilter(SeenFilter):
+    ''' Exact set of 64-bit fingerprints. '''
+
+    def __init__(self):
+        super().__init__()
+        self.fps = set()
+
+    def __contains__(self, fp):
+        return fp in self.fps
+
+    def __len__(self):
+        return len(self.fps)
+
+    def add(self, fp):
+        self.fps.add(fp)
+
+    def update(self, fps):
+        self.fps.update(fps)
+
+
+class BloomSeenFilter(SeenFilter):
+    ''' Bloom filter sized from a memory budget and a false positive rate.
+
+    A false positive makes the frontier drop a url it has never seen, so
+    error_rate is the fraction of new urls that may be lost once the filter
+    holds capacity urls. Past capacity the error rate grows. '''
+
+    def __init__(self, error_rate=0.001, memory_mb=64):
+        super().__init__()
+        self.num_bits = int(memory_mb * 8 * 1024 * 1024)
+        self.num_hashes = max(1, round(-math.log2(error_rate)))
+        self.capacity = int(
+            self.num_bits * math.log(2) ** 2 / -math.log(error_rate))
+        self.bits = bytearray(self.num_bits // 8 + 1)
+        self.count = 0
+
+    def _indexes(self, fp):
+        h2 = _mix(fp) | 1
+        for i in range(self.num_hashes):
+            yield (fp + i * h2) % self.num_bits
+
+    def __contains__(self, fp):
+        bits = self.bits
+        return all(
+            bits[index >> 3] & (1 << (index & 7))
+            for index in self._indexes(fp))
+
+    def __len__(self):
+        return self.count
+
+    def add(self, fp):
+        bits = self.bits
+        for index in self._indexes(fp):
+            bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def stats(self):
+        return (
+            f"{super().stats()}, {self.count}/{self.capacity} "
+            f"of bloom capacity used")
+
+
+def make_seen_filter(config):
+    if config.seen_filter == "bloom":
+        return BloomSeenFilter(config.bloom_error_rate, config.bloom_memory)
+    if config.seen_filter == "exact":
+        return ExactSeenFilter()
+    raise ValueError(
+        f"Unknown seen filter {config.seen_filter!r}, "
+        f"expected 'exact' or 'bloom'.")
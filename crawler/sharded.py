@@ -0,0 +1,267 @@
+import copy
+import multiprocessing
+import queue
+import zlib
+from functools import partial
+from multiprocessing.managers import BaseManager
+from threading import Thread, BrokenBarrierError
+from urllib.parse import urlparse
+
+from utils import get_logger, configure_logging, stop_logging
+from utils.urlcanon import canonicalize
+from crawler.frontier import Frontier
+from crawler.worker import share_dedup
+from crawlerstats import configure_stats, export_stats, merge_stats
+from dedup import NearDuplicateIndex, ContentFingerprintIndex
+
+
+def shard_of(url, num_shards):
+    # Stable across processes and runs, unlike hash().
+    return zlib.crc32(urlparse(url).netloc.lower().encode("utf-8")) % num_shards
+
+
+def shard_config(config, shard_id):
+    # Each shard keeps its own save file, robots.txt snapshot, checkpoint and
+    # page store, and serves its metrics on the next port.
+    config = copy.copy(config)
+    config.save_file = f"{config.save_file}.shard{shard_id}"
+    config.robots_file = f"{config.robots_file}.shard{shard_id}"
+    config.stats_file = f"{config.stats_file}.shard{shard_id}"
+    config.page_store = f"{config.page_store}.shard{shard_id}"
+    if config.metrics_port:
+        config.metrics_port += shard_id
+    return config
+
+
+class DedupManager(BaseManager):
+    ''' Process serving the duplicate page indexes shared by the shards, so
+    a page duplicating one of another shard's hosts is found too. The
+    shards send signatures and fingerprints, not pages. '''
+
+
+DedupManager.register("NearDuplicateIndex", NearDuplicateIndex)
+DedupManager.register("ContentFingerprintIndex", ContentFingerprintIndex)
+
+
+class ShardCoordinator(object):
+    ''' State shared by the shards, to start and end the crawl together.
+
+    Shards start crawling once all of them loaded their checkpoint, which
+    for shard 0 includes the shared duplicate indexes. The crawl is over
+    when every shard is idle (nothing queued or in flight) and no
+    forwarded url is still in an inbox, or when any shard stops it. A
+    shard receiving a url counts as busy again until it finds itself idle.
+    MAXPAGES counts the pages of all shards. '''
+
+    def __init__(self, context, num_shards):
+        self.lock = context.Lock()
+        self.ready = context.Barrier(num_shards)
+        self.idle = context.Array("b", num_shards, lock=False)
+        self.outstanding = context.Value("q", 0, lock=False)
+        self.pages = context.Value("q", 0, lock=False)
+        self.terminated = context.Value("b", 0, lock=False)
+
+    def forwarded(self):
+        with self.lock:
+            self.outstanding.value += 1
+
+    def received(self, shard_id):
+        with self.lock:
+            self.idle[shard_id] = 0
+            self.outstanding.value -= 1
+
+    def report_idle(self, shard_id, idle):
+        # Returns True if the crawl is over.
+        with self.lock:
+            self.idle[shard_id] = idle
+            if idle and not self.outstanding.value and all(self.idle):
+                self.terminated.value = 1
+            return bool(self.terminated.value)
+
+    def page_crawled(self, max_pages):
+        # Returns True once all shards together reached max_pages.
+        with self.lock:
+            self.pages.value += 1
+            return bool(max_pages) and self.pages.value >= max_pages
+
+    def stop(self):
+        self.terminated.value = 1
+        # Shards still waiting to start fail instead of waiting forever.
+        self.ready.abort()
+
+    @property
+    def stopped(self):
+        return bool(self.terminated.value)
+
+
+class ShardedFrontier(Frontier):
+    ''' Frontier owning the hosts that shard_of maps to shard_id.
+
+    urls of other hosts are forwarded to their owner's inbox, one batch per
+    page and shard, and a thread adds the urls forwarded to this shard. Each host is crawled by exactly
+    one process, so per-host politeness holds across processes. '''
+
+    def __init__(self, config, restart, shard_id, inboxes, coordinator):
+        self.shard_id = shard_id
+        self.inboxes = inboxes
+        self.coordinator = coordinator
+        super().__init__(config, restart)
+        # Other shards do not notify this one: check again now and then.
+        self.idle_wait = 0.5
+        Thread(target=self._receive, daemon=True).start()
+
+    def _receive(self):
+        inbox = self.inboxes[self.shard_id]
+        while True:
+            try:
+                urls, depth = inbox.get()
+            except (EOFError, OSError):
+                # Queue closed at shutdown
+                return
+            # Counted as received once queued: until then the urls are
+            # outstanding, and the crawl cannot end without them.
+            self._add_urls(urls, True, depth)
+            self.coordinator.received(self.shard_id)
+            with self.lock:
+                self.host_ready.notify_all()
+
+    def add_urls(self, urls, valid=True, parent=None):
+        # Only counts the new urls of this shard; forwarded urls are
+        # checked by their owner.
+        depth = self._child_depth(parent)
+        by_shard = {}
+        for url in dict.fromkeys(map(canonicalize, urls)):
+            by_shard.setdefault(shard_of(url, len(self.inboxes)), []).append(url)
+        for owner, owned in by_shard.items():
+            if owner != self.shard_id:
+                self.coordinator.forwarded()
+                self.inboxes[owner].put((owned, depth))
+        return self._add_urls(by_shard.get(self.shard_id, ()), valid, depth)
+
+    def _should_stop(self):
+        if self.coordinator.stopped and not self.stopped:
+            self.stop("The crawl ended in the other shards")
+        return super()._should_stop()
+
+    def _finished(self):
+        return self.coordinator.report_idle(self.shard_id, super()._finished())
+
+    def stop(self, reason):
+        self.coordinator.stop()
+        super().stop(reason)
+
+    def page_crawled(self):
+        if self.coordinator.page_crawled(self.config.max_pages):
+            self.stop(f"Crawled {self.config.max_pages} pages in all shards")
+
+
+def run_shard(engine, config, restart, shard_id, inboxes, coordinator, results,
+              indexes):
+    # Reports None instead of statistics if the shard fails, and stops the
+    # other shards, which would otherwise wait for it forever.
+    stats = None
+    try:
+        configure_logging(config)
+        share_dedup(*indexes, checkpointed=shard_id == 0)
+        frontier_factory = partial(
+            ShardedFrontier, shard_id=shard_id, inboxes=inboxes,
+            coordinator=coordinator)
+        crawler = engine(config, restart, frontier_factory=frontier_factory)
+        try:
+            coordinator.ready.wait()
+        except BrokenBarrierError:
+            # Another shard failed before starting.
+            crawler.frontier.close()
+            return
+        crawler.start()
+        stats = export_stats()
+    finally:
+        if stats is None:
+            coordinator.stop()
+        results.put((shard_id, stats))
+        # Child processes exit without running atexit handlers.
+        stop_logging()
+
+
+class MultiProcessCrawler(object):
+    ''' Runs config.processes crawler processes, each with its own shard of
+    the frontier and its own engine (threads or asyncio).
+
+    Duplicate pages are found across shards by indexes served by a
+    DedupManager process. When the shards finish, their statistics are
+    merged in shard order into this process, so print_stats reports the
+    whole crawl. The number of processes must stay the same when resuming
+    a crawl. '''
+
+    def __init__(self, config, restart, engine):
+        self.config = config
+        self.restart = restart
+        self.engine = engine
+        self.logger = get_logger("CRAWLER")
+        configure_stats(config)
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = list()
+        self.inboxes = list()
+        self.results = None
+        self.coordinator = None
+        self.dedup = None
+        self.indexes = None
+
+    def start_async(self):
+        num_shards = self.config.processes
+        # Kept referenced: the queues, the coordinator and the shared
+        # indexes must outlive the start of the children.
+        self.inboxes = [self.context.Queue() for _ in range(num_shards)]
+        self.results = self.context.Queue()
+        self.coordinator = ShardCoordinator(self.context, num_shards)
+        self.dedup = DedupManager(ctx=self.context)
+        self.dedup.start()
+        self.indexes = (
+            self.dedup.NearDuplicateIndex(threshold=self.config.near_dup_threshold),
+            self.dedup.ContentFingerprintIndex())
+        self.processes = [
+            self.context.Process(
+                target=run_shard,
+                args=(self.engine, shard_config(self.config, shard_id),
+                      self.restart, shard_id, self.inboxes, self.coordinator,
+                      self.results, self.indexes),
+                daemon=True)
+            for shard_id in range(num_shards)]
+        for process in self.processes:
+            process.start()
+        self.logger.info(f"Started {num_shards} crawler processes.")
+
+    def start(self):
+        self.start_async()
+        self.join()
+
+    def join(self):
+        # Collect before joining, a process cannot exit while its result
+        # is still buffered in the queue.
+        results = {}
+        while len(results) < len(self.processes):
+            try:
+                shard_id, state = self.results.get(timeout=1)
+            except queue.Empty:
+                if any(shard_id not in results and not process.is_alive()
+                       for shard_id, process in enumerate(self.processes)):
+                    # Killed before reporting: the other shards would
+                    # wait for it forever.
+                    self.coordinator.stop()
+                if not any(process.is_alive() for process in self.processes):
+                    break
+                continue
+            results[shard_id] = state
+        for process in self.processes:
+            process.join()
+        self.dedup.shutdown()
+        failed = [
+            shard_id for shard_id in range(len(self.processes))
+            if results.get(shard_id) is None]
+        if failed:
+            self.logger.error(
+                f"Crawler processes {failed} failed, their statistics are "
+                f"missing from the report.")
+        for shard_id in sorted(results):
+            if results[shard_id] is not None:
+                merge_stats(results[shard_id])
@@ -0,0 +1,353 @@
+import os
+import atexit
+import dbm
+import shelve
+import sqlite3
+import time
+
+from threading import Thread, RLock
+
+from utils.urlcanon import canonicalize, url_fingerprint
+
+
+class FrontierStore(object):
+    ''' Persistent fp -> (url, completed, valid) map used by the Frontier,
+    where fp is utils.urlcanon.url_fingerprint(url).
+
+    valid caches the is_valid decision for the url: True or False, or None if
+    it was never checked. pending() returns the urls still to be downloaded,
+    so a resumed crawl does not have to read or re-validate completed urls.
+
+    The backing file is opened once and kept open. Writes are buffered in
+    memory and committed as one group, either when commit_batch writes are
+    pending or every commit_interval seconds, whichever comes first. At most
+    commit_interval seconds of progress can be lost on a crash; a
+    commit_interval of 0 commits every write immediately.
+
+    Save files of earlier versions are keyed by a sha256 hex digest of the
+    url. They are rewritten to fingerprint keys when opened, with their urls
+    canonicalized; aliases that now share a fingerprint are merged, and
+    count as completed if any of them was. migrated is the number of
+    records rewritten.
+
+    Subclasses implement _read, _write, _count, _keys, _values, _pending and
+    _close. '''
+
+    def __init__(self, path, commit_interval=1.0, commit_batch=1000):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+
+        self.lock = RLock()
+        self.uncommitted = {}
+        self.closed = False
+        self.migrated = 0
+
+        if self.commit_interval > 0:
+            self.flusher = Thread(target=self._flush_loop, daemon=True)
+            self.flusher.start()
+        atexit.register(self.close)
+
+    def _flush_loop(self):
+        while not self.closed:
+            time.sleep(self.commit_interval)
+            self.commit()
+
+    def __contains__(self, fp):
+        return self.get(fp) is not None
+
+    def __getitem__(self, fp):
+        value = self.get(fp)
+        if value is None:
+            raise KeyError(fp)
+        return value
+
+    def __setitem__(self, fp, value):
+        with self.lock:
+            self.uncommitted[fp] = value
+            if self.commit_interval <= 0 or len(self.uncommitted) >= self.commit_batch:
+                self.commit()
+
+    def update(self, items):
+        # Several (fp, value) writes at once, in the same group commit.
+        with self.lock:
+            self.uncommitted.update(items)
+            if self.commit_interval <= 0 or len(self.uncommitted) >= self.commit_batch:
+                self.commit()
+
+    def __len__(self):
+        with self.lock:
+            self.commit()
+            return self._count()
+
+    def get(self, fp, default=None):
+        with self.lock:
+            if fp in self.uncommitted:
+                return self.uncommitted[fp]
+            value = self._read(fp)
+        return default if value is None else value
+
+    def keys(self):
+        with self.lock:
+            self.commit()
+            return self._keys()
+
+    def values(self):
+        with self.lock:
+            self.commit()
+            return self._values()
+
+    def pending(self):
+        # [(fp, url, valid)] of all urls that are not completed.
+        with self.lock:
+            self.commit()
+            return self._pending()
+
+    def commit(self):
+        with self.lock:
+            if not self.uncommitted or self.closed:
+                return
+            self._write(self.uncommitted.items())
+            self.uncommitted = {}
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.commit()
+            self.closed = True
+            self._close()
+
+    def _read(self, fp):
+        raise NotImplementedError
+
+    def _write(self, items):
+        raise NotImplementedError
+
+    def _count(self):
+        raise NotImplementedError
+
+    def _keys(self):
+        raise NotImplementedError
+
+    def _values(self):
+        raise NotImplementedError
+
+    def _pending(self):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    @staticmethod
+    def _migrated_records(values):
+        # {fp: (url, completed, valid)} from (url, completed, valid) records
+        # keyed the old way.
+        records = {}
+        for url, completed, valid in values:
+            url = canonicalize(url)
+            fp = url_fingerprint(url)
+            old = records.get(fp)
+            if old is not None and old[1]:
+                continue
+            if old is not None and not completed and valid is None:
+                valid = old[2]
+            records[fp] = (url, bool(completed), valid)
+        return records
+
+
+class ShelveStore(FrontierStore):
+    ''' dbm backed store, compatible with save files of earlier versions.
+
+    dbm keys are strings: fingerprints are stored as 16 hex digits. dbm has
+    no secondary index, so pending() scans every record. '''
+
+    def __init__(self, path, commit_interval=1.0, commit_batch=1000):
+        self.save = shelve.open(path, flag='c', protocol=None, writeback=False)
+        super().__init__(path, commit_interval, commit_batch)
+        with self.lock:
+            self._migrate()
+
+    @staticmethod
+    def _key(fp):
+        return f"{fp:016x}"
+
+    def _migrate(self):
+        # Earlier save files are keyed by 64 hex digit sha256 digests.
+        old_keys = [key for key in self.save.keys() if len(key) != 16]
+        if not old_keys:
+            return
+        records = self._migrated_records(
+            self._upgrade(self.save[key]) for key in old_keys)
+        for key in old_keys:
+            del self.save[key]
+        for fp, value in records.items():
+            self.save[self._key(fp)] = value
+        self.save.sync()
+        self.migrated = len(old_keys)
+
+    def _read(self, fp):
+        value = self.save.get(self._key(fp))
+        return None if value is None else self._upgrade(value)
+
+    @staticmethod
+    def _upgrade(value):
+        # Earlier save files store (url, completed).
+        return value if len(value) == 3 else (*value, None)
+
+    def _write(self, items):
+        for fp, value in items:
+            self.save[self._key(fp)] = value
+        self.save.sync()
+
+    def _count(self):
+        return len(self.save)
+
+    def _keys(self):
+        return [int(key, 16) for key in self.save.keys()]
+
+    def _values(self):
+        return [self._upgrade(value) for value in self.save.values()]
+
+    def _pending(self):
+        pending = []
+        for key, value in self.save.items():
+            url, completed, valid = self._upgrade(value)
+            if not completed:
+                pending.append((int(key, 16), url, valid))
+        return pending
+
+    def _close(self):
+        self.save.close()
+
+
+class SqliteStore(FrontierStore):
+    ''' SQLite store in WAL mode; each group commit is a single transaction.
+
+    Fingerprints are the INTEGER PRIMARY KEY (the rowid), stored as signed
+    64-bit integers. A partial index over the uncompleted rows makes
+    pending() proportional to the number of pending urls. '''
+
+    def __init__(self, path, commit_interval=1.0, commit_batch=1000):
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        super().__init__(path, commit_interval, commit_batch)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(urls)")]
+        if "urlhash" in columns:
+            self._migrate("valid" in columns)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "fp INTEGER PRIMARY KEY, url TEXT NOT NULL, "
+            "completed INTEGER NOT NULL, valid INTEGER)")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS pending_urls ON urls (completed) "
+            "WHERE completed = 0")
+
+    @staticmethod
+    def _signed(fp):
+        return fp - (1 << 64) if fp >= 1 << 63 else fp
+
+    @staticmethod
+    def _unsigned(fp):
+        return fp + (1 << 64) if fp < 0 else fp
+
+    def _migrate(self, has_valid):
+        # Earlier save files are keyed by sha256 hex digests (urlhash TEXT),
+        # some without the valid column. Rewritten in one transaction.
+        valid = "valid" if has_valid else "NULL"
+        records = self._migrated_records(
+            self._decode(*row) for row in self.conn.execute(
+                f"SELECT url, completed, {valid} FROM urls"))
+        self.conn.execute("BEGIN")
+        self.conn.execute("DROP INDEX IF EXISTS pending_urls")
+        self.migrated = self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        self.conn.execute("DROP TABLE urls")
+        self.conn.execute(
+            "CREATE TABLE urls ("
+            "fp INTEGER PRIMARY KEY, url TEXT NOT NULL, "
+            "completed INTEGER NOT NULL, valid INTEGER)")
+        self.conn.executemany(
+            "INSERT INTO urls (fp, url, completed, valid) VALUES (?, ?, ?, ?)",
+            [(self._signed(fp), url, int(completed), None if valid is None else int(valid))
+             for fp, (url, completed, valid) in records.items()])
+        self.conn.execute("COMMIT")
+
+    def _read(self, fp):
+        row = self.conn.execute(
+            "SELECT url, completed, valid FROM urls WHERE fp = ?",
+            (self._signed(fp),)).fetchone()
+        if row is None:
+            return None
+        return self._decode(*row)
+
+    @staticmethod
+    def _decode(url, completed, valid):
+        return (url, bool(completed), None if valid is None else bool(valid))
+
+    def _write(self, items):
+        self.conn.execute("BEGIN")
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO urls (fp, url, completed, valid) "
+            "VALUES (?, ?, ?, ?)",
+            [(self._signed(fp), url, int(completed), None if valid is None else int(valid))
+             for fp, (url, completed, valid) in items])
+        self.conn.execute("COMMIT")
+
+    def _count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def _keys(self):
+        return [
+            self._unsigned(fp) for fp, in
+            self.conn.execute("SELECT fp FROM urls")]
+
+    def _values(self):
+        return [
+            self._decode(*row) for row in
+            self.conn.execute("SELECT url, completed, valid FROM urls")]
+
+    def _pending(self):
+        return [
+            (self._unsigned(fp), url, None if valid is None else bool(valid))
+            for fp, url, valid in self.conn.execute(
+                "SELECT fp, url, valid FROM urls WHERE completed = 0")]
+
+    def _close(self):
+        self.conn.close()
+
+
+STORES = {
+    "shelve": ShelveStore,
+    "sqlite": SqliteStore,
+}
+
+
+def open_store(config):
+    if config.store not in STORES:
+        raise ValueError(
+            f"Unknown frontier store {config.store!r}, "
+            f"expected one of {sorted(STORES)}.")
+    store = config.store
+    if dbm.whichdb(config.save_file):
+        # An existing dbm save file, e.g. of a crawl started before sqlite
+        # was the default, can only be read by ShelveStore.
+        store = "shelve"
+    return STORES[store](
+        config.save_file, commit_interval=config.commit_interval)
+
+
+# Files a save file may consist of: sqlite WAL side files and the
+# extensions added by the different dbm implementations behind shelve.
+STORE_SUFFIXES = ("", "-wal", "-shm", ".db", ".dat", ".dir", ".bak")
+
+
+def store_exists(path):
+    return any(os.path.exists(f"{path}{suffix}") for suffix in STORE_SUFFIXES)
+
+
+def remove_store(path):
+    for suffix in STORE_SUFFIXES:
+        if os.path.exists(f"{path}{suffix}"):
+            os.remove(f"{path}{suffix}")
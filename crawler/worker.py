@@ -2,22 +2,55 @@ from threading import Thread
 
 from inspect import getsource
 from utils.download import download
-from utils import get_logger
+from utils import get_logger, SAMPLED
 import scraper
-import time
 
 from urllib.parse import urlparse
 from collections import Counter
 from threading import Lock
-from bs4 import BeautifulSoup
-from tokenizer import tokenize, computeWordFrequencies
+from pageparser import parse_page
+from tokenizer import tokenize_and_count
 from crawlerstats import update_word_freq, unique_url, record_page_length, unique_subdomains, increment_page_count
+from dedup import (
+    NearDuplicateIndex, ContentFingerprintIndex, SharedNearDuplicateIndex,
+    SharedContentFingerprintIndex)
+from contentgate import get_content_gate
+from utils.metrics import time_stage, PAGES, NEW_LINKS
 
 freq_lock = Lock()
 global_word_freq = Counter()
 
-unique_pages = []
-unique_pages_lock = Lock()
+# Pages kept so far, for near-duplicate detection (configure_dedup)
+unique_pages = NearDuplicateIndex()
+# Bodies of every page downloaded so far, for exact duplicates
+unique_contents = ContentFingerprintIndex()
+# (near-duplicate index, content index, checkpointed) shared by all
+# crawler processes (share_dedup), or None for indexes of this process
+shared_indexes = None
+
+
+def share_dedup(pages, contents, checkpointed):
+    # Makes configure_dedup use indexes served by another process, so
+    # duplicates are found across crawler processes. Only the process with
+    # checkpointed set saves and loads them in its checkpoint.
+    global shared_indexes
+    shared_indexes = (pages, contents, checkpointed)
+
+
+def configure_dedup(config):
+    # Call before crawling; any pages indexed so far in this process are dropped.
+    global unique_pages, unique_contents
+    if not 0 < config.near_dup_threshold <= 1:
+        raise ValueError(
+            f"NEARDUPTHRESHOLD must be in (0, 1], not {config.near_dup_threshold}.")
+    if shared_indexes is None:
+        unique_pages = NearDuplicateIndex(threshold=config.near_dup_threshold)
+        unique_contents = ContentFingerprintIndex()
+    else:
+        pages, contents, checkpointed = shared_indexes
+        unique_pages = SharedNearDuplicateIndex(
+            pages, checkpointed, threshold=config.near_dup_threshold)
+        unique_contents = SharedContentFingerprintIndex(contents, checkpointed)
 
 
 class Worker(Thread):
@@ -34,67 +67,96 @@ class Worker(Thread):
         while True:
             tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
-                time.sleep(0.5)
-                continue
-                # self.logger.info("Frontier is empty. Stopping Crawler.")
-                # break
-
-            # Download page
-            resp = download(tbd_url, self.config, self.logger)
-            if resp:
-                self.logger.info(
-                    f"Downloaded {tbd_url}, status <{resp.status}>, "
-                    f"using cache {self.config.cache_server}.")
-
-            # Tokenize page
-            if resp and resp.status == 200:
-                # Record unique url
-                unique_url(tbd_url)
-
-                soup = BeautifulSoup(resp.raw_response.content, 'html.parser')
-                for tag in soup(['script', 'style']):
-                    tag.decompose()
-                visible_text = soup.get_text(separator=" ", strip=True)
-
-                token_list = tokenize(visible_text)
-                freq_map = computeWordFrequencies(token_list)
-                
-                # Check for low-value pages
-                # low tokens, or low unique tokens
-                if len(token_list) < 100 or len(freq_map) / len(token_list) < 0.2:    
-                    self.frontier.mark_url_complete(tbd_url)
-                    continue
-
-                # Check for duplicate and near-duplicate pages
-                is_duplicate = False
-                curr_set = set(freq_map.keys())
-                with unique_pages_lock:
-                    for page_set in unique_pages:
-                        # similarity = |A ∩ B| / |A ∪ B|
-                        intersection = len(curr_set & page_set)
-                        union = len(curr_set | page_set)
-                        similarity = intersection / union
-                        if similarity >= 0.85:
-                            is_duplicate = True
-                            break
-                    if not is_duplicate:
-                        unique_pages.append(curr_set)
-                if is_duplicate:
-                    self.frontier.mark_url_complete(tbd_url)
-                    continue
-
-                # Requirements
-                record_page_length(tbd_url, sum(freq_map.values()))
-                update_word_freq(freq_map)
-                unique_subdomains(tbd_url)
-                increment_page_count()
-
-                # if increment_page_count():
-                #     # self.logger.info(f"Crawled {self.config.max_pages} pages. Stopping Crawler.")
-                #     break
-
-            # Scrape urls
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
+                self.logger.info("Frontier is empty. Stopping Crawler.")
+                break
+
+            try:
+                # Download page
+                with time_stage("download"):
+                    resp = download(tbd_url, self.config, self.logger)
+                if resp:
+                    self.logger.info(
+                        f"Downloaded {tbd_url}, status <{resp.status}>, "
+                        f"using cache {self.config.cache_server} "
+                        f"in {resp.latency:.3f}s.", extra=SAMPLED)
+                process_page(tbd_url, resp, self.config, self.frontier, self.logger)
+            except Exception:
+                # Completed anyway, or the crawl would wait for it forever.
+                self.logger.exception(f"Failed to process {tbd_url}.")
+                mark_complete(self.frontier, tbd_url, "error")
+
+
+def mark_complete(frontier, url, outcome):
+    PAGES.inc(outcome)
+    with time_stage("mark_complete"):
+        frontier.mark_url_complete(url, kept=outcome == "crawled")
+
+
+def process_page(tbd_url, resp, config, frontier, logger):
+    # Everything after the download: dedup, tokenize, statistics, and
+    # adding the scraped links to the frontier. Shared by all engines.
+
+    # Tokenize page
+    page = None
+    if resp and resp.status == 200:
+        # Record unique url
+        unique_url(tbd_url)
+
+        # Skip large, binary and non-text pages before decoding them further
+        with time_stage("content_gate"):
+            gate_check = get_content_gate().rejecting_check(resp)
+        if gate_check:
+            logger.info(
+                f"Skipped {tbd_url}, rejected by the content gate ({gate_check}).",
+                extra=SAMPLED)
+            mark_complete(frontier, tbd_url, "gated")
+            return
+
+        # Skip exact duplicates before parsing
+        with time_stage("exact_dedup"):
+            duplicate = unique_contents.query_and_insert(resp.raw_response.content)
+        if duplicate:
+            logger.info(
+                f"Skipped {tbd_url}, exact duplicate content "
+                f"({unique_contents.skipped} skipped so far).", extra=SAMPLED)
+            mark_complete(frontier, tbd_url, "duplicate")
+            return
+
+        # Parse once, for both the visible text and the links
+        with time_stage("parse"):
+            page = parse_page(
+                tbd_url, resp.raw_response.content, config.parser,
+                resp.raw_response.encoding)
+        visible_text = page.text
+
+        with time_stage("tokenize"):
+            token_count, freq_map = tokenize_and_count(visible_text)
+        
+        # Check for low-value pages
+        # low tokens, or low unique tokens
+        if token_count < 100 or len(freq_map) / token_count < 0.2:    
+            mark_complete(frontier, tbd_url, "low_value")
+            return
+
+        # Check for duplicate and near-duplicate pages
+        # similarity = |A ∩ B| / |A ∪ B|, estimated from MinHash signatures
+        with time_stage("near_dedup"):
+            near_duplicate = unique_pages.query_and_insert(freq_map.keys())
+        if near_duplicate:
+            mark_complete(frontier, tbd_url, "near_duplicate")
+            return
+
+        # Requirements
+        with time_stage("stats"):
+            record_page_length(tbd_url, token_count)
+            update_word_freq(freq_map)
+            unique_subdomains(tbd_url)
+            increment_page_count()
+        frontier.page_crawled()
+
+    # Scrape urls
+    with time_stage("scrape"):
+        scraped_urls = scraper.scraper(tbd_url, resp, page)
+    with time_stage("add_urls"):
+        NEW_LINKS.observe(frontier.add_urls(scraped_urls, parent=tbd_url))
+    mark_complete(frontier, tbd_url, "crawled" if page else "error")
@@ -1,51 +1,183 @@
-from threading import Lock
+import copy
+import math
+from threading import Lock, local
+from itertools import count
 from collections import defaultdict, Counter
-from urllib.parse import urlparse, urldefrag
+from urllib.parse import urlparse
 
+from sketches import HyperLogLog, TopKCounter
+from utils.urlcanon import url_fingerprint
 
-stats_lock = Lock()
+# Each thread records into its own Stats accumulator, guarded by its own
+# lock, which is only contended while the accumulator is being merged.
+# merge() moves every accumulator's contents into `merged`; snapshot()
+# merges and returns a copy of the totals.
+# In the "sketch" mode (configure_stats), `merged` keeps unique urls and
+# word counts in fixed-memory sketches; the accumulators stay exact.
 
 # page_lock = Lock()
 # STOP_CRAWL = False
 
-pages_crawled = 0
-MAX_PAGES_TO_CRAWL = 25 # Testing
-
-# Other Requirements
-# 1. Number of unique URLs
-unique_urls = set()
-
-# 2. Longest page (by word count)
-longest_page = None
-longest_page_length = 0
-
-# 3. Total word frequency map
-word_freq = Counter()
-
-# 4. Number of subdomains
-subdomains = defaultdict(int)
+# Merge the per-thread accumulators every this many pages
+MERGE_EVERY = 500
+# Rough memory per word tracked by the TopKCounter, in bytes
+WORD_ENTRY_SIZE = 200
+
+
+class Stats(object):
+    def __init__(self, unique_urls=None, word_freq=None):
+        self.lock = Lock()
+        self.pages_crawled = 0
+        # Other Requirements
+        # 1. Number of unique URLs, as utils.urlcanon fingerprints
+        self.unique_urls = set() if unique_urls is None else unique_urls
+        # 2. Longest page (by word count)
+        self.longest_page = None
+        self.longest_page_length = 0
+        # 3. Total word frequency map
+        self.word_freq = Counter() if word_freq is None else word_freq
+        # 4. Number of subdomains
+        self.subdomains = defaultdict(int)
+
+    def update(self, other):
+        # Fold other's statistics into these.
+        self.pages_crawled += other.pages_crawled
+        if isinstance(other.unique_urls, HyperLogLog):
+            self.unique_urls.merge(other.unique_urls)
+        else:
+            self.unique_urls.update(other.unique_urls)
+        if other.longest_page_length > self.longest_page_length:
+            self.longest_page = other.longest_page
+            self.longest_page_length = other.longest_page_length
+        if isinstance(other.word_freq, TopKCounter):
+            self.word_freq.merge(other.word_freq)
+        else:
+            self.word_freq.update(other.word_freq)
+        for subdomain, count in other.subdomains.items():
+            self.subdomains[subdomain] += count
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def drain(self):
+        # Move the statistics out into a new Stats and start over empty.
+        # Only swaps references, so the owning thread waits very little.
+        drained = Stats()
+        with self.lock:
+            (drained.pages_crawled, drained.unique_urls, drained.longest_page,
+             drained.longest_page_length, drained.word_freq, drained.subdomains) = (
+                self.pages_crawled, self.unique_urls, self.longest_page,
+                self.longest_page_length, self.word_freq, self.subdomains)
+            self.pages_crawled = 0
+            self.unique_urls = set()
+            self.word_freq = Counter()
+            self.subdomains = defaultdict(int)
+        return drained
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+
+accumulators_lock = Lock()
+accumulators = []
+merged = Stats()
+merge_lock = Lock()
+page_counter = count(1)
+_local = local()
+
+
+def sketched_stats(memory_mb):
+    # Stats within about memory_mb MB: the largest HyperLogLog up to a
+    # sixteenth of the budget, the rest for the top words. The TopKCounter
+    # tracks up to 2 * capacity words.
+    budget = int(memory_mb * 1024 * 1024)
+    precision = max(4, min(18, int(math.log2(max(budget // 16, 1)))))
+    capacity = max(150, (budget - (1 << precision)) // (2 * WORD_ENTRY_SIZE))
+    return Stats(HyperLogLog(precision), TopKCounter(capacity))
+
+
+def configure_stats(config):
+    # Call before crawling; any statistics recorded so far are dropped.
+    global merged
+    if config.stats_mode == "exact":
+        stats = Stats()
+    elif config.stats_mode == "sketch":
+        stats = sketched_stats(config.stats_memory)
+    else:
+        raise ValueError(f"Unknown STATS mode {config.stats_mode!r}.")
+    with merge_lock:
+        merged = stats
+
+
+def restore_stats(stats):
+    # Continue from saved statistics, e.g. a checkpoint, instead of empty.
+    global merged, page_counter
+    with merge_lock:
+        merged = stats
+        page_counter = count(stats.pages_crawled + 1)
+
+
+def _accumulator():
+    stats = getattr(_local, "stats", None)
+    if stats is None:
+        stats = _local.stats = Stats()
+        with accumulators_lock:
+            accumulators.append(stats)
+    return stats
+
+
+def merge(blocking=True):
+    # Returns False, without merging, if not blocking and a merge or
+    # snapshot (e.g. a checkpoint copying the totals) is in progress.
+    if not merge_lock.acquire(blocking):
+        return False
+    try:
+        with accumulators_lock:
+            current = list(accumulators)
+        for stats in current:
+            merged.update(stats.drain())
+    finally:
+        merge_lock.release()
+    return True
+
+
+def snapshot():
+    # Consistent copy of the totals so far, usable while crawling.
+    merge()
+    with merge_lock:
+        return merged.copy()
 
 
 def increment_page_count():
-    global pages_crawled, STOP_CRAWL
-    with stats_lock:
-        pages_crawled += 1
-        # if pages_crawled % 100 == 0:
-        #     print(f"---Crawled {pages_crawled} pages---")
-        return pages_crawled >= MAX_PAGES_TO_CRAWL
+    pages = next(page_counter)
+    stats = _accumulator()
+    with stats.lock:
+        stats.pages_crawled += 1
+    if pages % MERGE_EVERY == 0:
+        # Workers never wait for a merge: if one is running, the
+        # accumulators are merged by the next one.
+        merge(blocking=False)
+        # print(f"---Crawled {pages} pages---")
 
 def unique_url(url):
-    cleaned_url, _ = urldefrag(url)
-    with stats_lock:
-        unique_urls.add(cleaned_url)
+    fp = url_fingerprint(url)
+    stats = _accumulator()
+    with stats.lock:
+        stats.unique_urls.add(fp)
 
 
 def record_page_length(url, word_count):
-    global longest_page, longest_page_length
-    with stats_lock:
-        if word_count > longest_page_length:
-            longest_page = url
-            longest_page_length = word_count
+    stats = _accumulator()
+    with stats.lock:
+        if word_count > stats.longest_page_length:
+            stats.longest_page = url
+            stats.longest_page_length = word_count
 
 
 STOP_WORDS = {
@@ -79,9 +211,9 @@ STOP_WORDS = {
 
 def update_word_freq(curr_freq):
     filtered = {word: count for word, count in curr_freq.items() if word not in STOP_WORDS}
-    with stats_lock:
-        for word, count in filtered.items():
-            word_freq[word] += count
+    stats = _accumulator()
+    with stats.lock:
+        stats.word_freq.update(filtered)
 
 
 def unique_subdomains(url):
@@ -89,22 +221,35 @@ def unique_subdomains(url):
     host = parsed.netloc.lower()
 
     if host.endswith(".uci.edu"):
-        with stats_lock:
-            subdomains[host] += 1
-
-def print_stats():
+        stats = _accumulator()
+        with stats.lock:
+            stats.subdomains[host] += 1
+
+def export_stats():
+    # Picklable copy of the statistics, for merging across processes
+    return snapshot()
+
+def merge_stats(stats):
+    # Fold statistics from export_stats into this process'.
+    # Merging in a fixed order gives the same result on every run.
+    with merge_lock:
+        merged.update(stats)
+
+def print_stats(stats=None):
+    if stats is None:
+        stats = snapshot()
     print("### Statistics ###")
-    print(f"Unique URLs: {len(unique_urls)}")
-    print(f"Longest page: {longest_page}")
-    print(f"Longest page word count: {longest_page_length}")
+    print(f"Unique URLs: {len(stats.unique_urls)}")
+    print(f"Longest page: {stats.longest_page}")
+    print(f"Longest page word count: {stats.longest_page_length}")
 
     print(f"Top 150 words:")
-    for word, count in word_freq.most_common(150):
+    for word, count in stats.word_freq.most_common(150):
         print(f"{word}: {count}")
 
-    print(f"Subdomains: {len(subdomains)}")
+    print(f"Subdomains: {len(stats.subdomains)}")
     # Alphabetical order
-    for subdomain in sorted(subdomains.keys()):
-        print(f"{subdomain}: {subdomains[subdomain]}")
+    for subdomain in sorted(stats.subdomains.keys()):
+        print(f"{subdomain}: {stats.subdomains[subdomain]}")
     # for subdomain, count in subdomains.items():
     #     print(f"{subdomain}: {count}")
\ No newline at end of file
@@ -0,0 +1,229 @@
+import re
+import zlib
+from array import array
+from hashlib import blake2b
+from threading import Lock
+
+MASK_64 = (1 << 64) - 1
+# Odd multiplier spreading 32-bit token hashes over 64 bits.
+GOLDEN_RATIO = 0x9E3779B97F4A7C15
+ROTATION_OFFSET = 0x5851F42D4C957F2D
+EMPTY = MASK_64
+
+WHITESPACE = re.compile(rb"\s+")
+
+
+# Probability that a page at exactly the threshold similarity shares a band
+# with the page it duplicates. similarity() drops the extra candidates.
+BAND_RECALL = 0.99
+
+
+def recall_bands(threshold, num_perm, recall=BAND_RECALL):
+    # (bands, rows) with the most rows per band, so the fewest candidates,
+    # that still makes a pair at threshold a candidate with probability recall.
+    for rows in range(num_perm, 0, -1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            return bands, rows
+    return num_perm, 1
+
+
+class NearDuplicateIndex(object):
+    ''' Near-duplicate page detection with MinHash and LSH banding.
+
+    Each page is reduced to a fixed size MinHash signature of its token set,
+    so memory per page does not depend on page size. Pages sharing a band
+    of their signature are candidates; the bands are chosen for recall (see
+    recall_bands). A candidate is a duplicate when the fraction of equal
+    signature values, an estimate of the Jaccard similarity, is at least
+    threshold. benchmarks/dedup_recall.py compares it with exact Jaccard. '''
+
+    def __init__(self, threshold=0.85, num_perm=128):
+        # num_perm must be a power of two.
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bin_bits = num_perm.bit_length() - 1
+        self.value_mask = (1 << (64 - self.bin_bits)) - 1
+        self.bands, self.rows = recall_bands(threshold, num_perm)
+
+        self.lock = Lock()
+        self.signatures = []
+        self.buckets = [dict() for _ in range(self.bands)]
+
+    def signature(self, tokens):
+        # One permutation hashing: the top bits of each token hash pick one
+        # of num_perm bins and every bin keeps its minimum, so a signature
+        # costs one pass over the tokens. Empty bins borrow the value of
+        # the next non-empty bin (densification by rotation).
+        num_perm = self.num_perm
+        shift = 64 - self.bin_bits
+        signature = [EMPTY] * num_perm
+        for token in set(tokens):
+            h = zlib.crc32(token.encode("utf-8")) * GOLDEN_RATIO & MASK_64
+            bin_id = h >> shift
+            value = h & self.value_mask
+            if value < signature[bin_id]:
+                signature[bin_id] = value
+
+        if EMPTY in signature and any(v != EMPTY for v in signature):
+            filled = list(signature)
+            for bin_id in range(num_perm):
+                if filled[bin_id] != EMPTY:
+                    continue
+                distance = 1
+                while filled[(bin_id + distance) % num_perm] == EMPTY:
+                    distance += 1
+                # Offset keeps borrowed values apart from real ones.
+                signature[bin_id] = (
+                    filled[(bin_id + distance) % num_perm]
+                    + distance * ROTATION_OFFSET) & MASK_64
+        return array('Q', signature)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [
+            hash(tuple(signature[band * rows:(band + 1) * rows]))
+            for band in range(self.bands)]
+
+    def similarity(self, sig_a, sig_b):
+        return sum(a == b for a, b in zip(sig_a, sig_b)) / self.num_perm
+
+    def query_and_insert(self, tokens):
+        # Returns True if tokens are a near duplicate of an indexed page,
+        # otherwise indexes them and returns False. Thread-safe.
+        return self.query_and_insert_signature(self.signature(tokens))
+
+    def query_and_insert_signature(self, signature):
+        keys = self._band_keys(signature)
+        with self.lock:
+            checked = set()
+            for bucket, key in zip(self.buckets, keys):
+                for page_id in bucket.get(key, ()):
+                    if page_id in checked:
+                        continue
+                    checked.add(page_id)
+                    if self.similarity(signature, self.signatures[page_id]) >= self.threshold:
+                        return True
+
+            page_id = len(self.signatures)
+            self.signatures.append(signature)
+            for bucket, key in zip(self.buckets, keys):
+                bucket.setdefault(key, []).append(page_id)
+        return False
+
+    def export_state(self):
+        # The buckets are rebuilt from the signatures on load. Signatures
+        # are never modified, so copying the list is a consistent snapshot.
+        with self.lock:
+            signatures = list(self.signatures)
+        return {"threshold": self.threshold, "num_perm": self.num_perm,
+                "signatures": signatures}
+
+    def load_state(self, state):
+        if (state["threshold"], state["num_perm"]) != (self.threshold, self.num_perm):
+            raise ValueError("Saved near-duplicate index has other parameters.")
+        buckets = [dict() for _ in range(self.bands)]
+        for page_id, signature in enumerate(state["signatures"]):
+            for bucket, key in zip(buckets, self._band_keys(signature)):
+                bucket.setdefault(key, []).append(page_id)
+        with self.lock:
+            self.signatures = list(state["signatures"])
+            self.buckets = buckets
+
+    def size(self):
+        return len(self.signatures)
+
+    __len__ = size
+
+
+class ContentFingerprintIndex(object):
+    ''' Exact duplicate detection on raw page bodies.
+
+    Bodies are fingerprinted after collapsing runs of whitespace, so pages
+    that differ only in whitespace match. This runs on the downloaded bytes,
+    before any parsing or tokenizing. skipped counts the duplicates found. '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.fingerprints = set()
+        self.skipped = 0
+
+    @staticmethod
+    def fingerprint(content):
+        normalized = WHITESPACE.sub(b" ", content).strip()
+        return int.from_bytes(blake2b(normalized, digest_size=8).digest(), "big")
+
+    def query_and_insert(self, content):
+        # Returns True if content was seen before, otherwise records it.
+        return self.query_and_insert_fingerprint(self.fingerprint(content))
+
+    def query_and_insert_fingerprint(self, fp):
+        with self.lock:
+            if fp in self.fingerprints:
+                self.skipped += 1
+                return True
+            self.fingerprints.add(fp)
+        return False
+
+    def export_state(self):
+        with self.lock:
+            return {"fingerprints": set(self.fingerprints), "skipped": self.skipped}
+
+    def load_state(self, state):
+        with self.lock:
+            self.fingerprints = set(state["fingerprints"])
+            self.skipped = state["skipped"]
+
+    def size(self):
+        return len(self.fingerprints)
+
+    __len__ = size
+
+
+
+class SharedIndexState(object):
+    ''' Checkpointing of an index shared by several processes: only the
+    process with checkpointed set exports and loads the shared state, the
+    others export None and ignore what they load. '''
+
+    def export_state(self):
+        return self.shared.export_state() if self.checkpointed else None
+
+    def load_state(self, state):
+        if self.checkpointed and state is not None:
+            self.shared.load_state(state)
+
+    def __len__(self):
+        return self.shared.size()
+
+
+class SharedNearDuplicateIndex(SharedIndexState, NearDuplicateIndex):
+    ''' Front for a NearDuplicateIndex shared by several processes, e.g. a
+    multiprocessing manager proxy. Signatures are computed in this process
+    and only they are sent to the shared index. '''
+
+    def __init__(self, shared, checkpointed, threshold=0.85, num_perm=128):
+        super().__init__(threshold, num_perm)
+        self.shared = shared
+        self.checkpointed = checkpointed
+
+    def query_and_insert_signature(self, signature):
+        return self.shared.query_and_insert_signature(signature)
+
+
+class SharedContentFingerprintIndex(SharedIndexState, ContentFingerprintIndex):
+    ''' Front for a ContentFingerprintIndex shared by several processes,
+    like SharedNearDuplicateIndex. skipped counts the duplicates found by
+    this process. '''
+
+    def __init__(self, shared, checkpointed):
+        super().__init__()
+        self.shared = shared
+        self.checkpointed = checkpointed
+
+    def query_and_insert_fingerprint(self, fp):
+        duplicate = self.shared.query_and_insert_fingerprint(fp)
+        if duplicate:
+            with self.lock:
+                self.skipped += 1
+        return duplicate
@@ -3,21 +3,40 @@ from argparse import ArgumentParser
 
 from utils.server_registration import get_cache_server
 from utils.config import Config
+from utils import configure_logging
 from crawler import Crawler
+from crawler.aio import AsyncCrawler
+from crawler.sharded import MultiProcessCrawler
 
 from crawlerstats import print_stats
 
 # print("Starting crawler")
 
 
-def main(config_file, restart):
+ENGINES = {
+    "threads": Crawler,
+    "asyncio": AsyncCrawler,
+}
+
+
+def main(config_file, restart, engine=None, processes=None):
     # print(f"Using config file: {config_file}")
     cparser = ConfigParser()
     cparser.read(config_file)
     # print("Config file loaded successfully.")
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    if engine:
+        config.engine = engine
+    if processes:
+        config.processes = processes
+    configure_logging(config)
+    if config.page_store_mode != "replay":
+        # Replay never contacts the cache server.
+        config.cache_server = get_cache_server(config, restart)
+    if config.processes > 1:
+        crawler = MultiProcessCrawler(config, restart, ENGINES[config.engine])
+    else:
+        crawler = ENGINES[config.engine](config, restart)
     # print("Starting crawler")
     crawler.start()
 
@@ -28,6 +47,8 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=None)
+    parser.add_argument("--processes", type=int, default=None)
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.engine, args.processes)
 
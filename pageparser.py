@@ -0,0 +1,105 @@
+from collections import namedtuple
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+# text: visible text, one space between strings (no script/style contents)
+# links: absolute urls of all <a href>, duplicates removed, in page order
+# length: size of the page body in bytes
+Page = namedtuple("Page", ["text", "links", "length"])
+
+SKIPPED_TAGS = {"script", "style"}
+
+
+def parse_page(url, content, backend="stream", encoding=None):
+    # Parse a page once and return everything the worker and scraper need.
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown parser {backend!r}, expected one of {sorted(BACKENDS)}.")
+    return BACKENDS[backend](url, content, encoding)
+
+
+def _parse_soup(url, content, encoding, features):
+    soup = BeautifulSoup(content, features, from_encoding=encoding)
+    links = []
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        if not href or href.strip() == '':
+            continue
+        links.append(urljoin(url, href))
+
+    for tag in soup(list(SKIPPED_TAGS)):
+        tag.decompose()
+    text = soup.get_text(separator=" ", strip=True)
+    return Page(text, list(dict.fromkeys(links)), len(content))
+
+
+def _parse_html_parser(url, content, encoding):
+    return _parse_soup(url, content, encoding, "html.parser")
+
+
+def _parse_lxml(url, content, encoding):
+    if lxml is None:
+        raise ImportError("The lxml parser requires the lxml package.")
+    return _parse_soup(url, content, encoding, "lxml")
+
+
+class StreamingPageParser(HTMLParser):
+    ''' Collects visible text and links in one pass without building a tree. '''
+
+    def __init__(self, url):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        self.text = []
+        self.links = {}
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag == "a":
+            for name, value in attrs:
+                if name == "href":
+                    if value and value.strip():
+                        self.links[urljoin(self.url, value)] = None
+                    break
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            data = data.strip()
+            if data:
+                self.text.append(data)
+
+
+def _decode(content, encoding):
+    for candidate in ("utf-8", encoding):
+        if candidate:
+            try:
+                return content.decode(candidate)
+            except (UnicodeDecodeError, LookupError):
+                pass
+    return content.decode("latin-1")
+
+
+def _parse_stream(url, content, encoding):
+    parser = StreamingPageParser(url)
+    parser.feed(_decode(content, encoding))
+    parser.close()
+    return Page(" ".join(parser.text), list(parser.links), len(content))
+
+
+BACKENDS = {
+    "stream": _parse_stream,
+    "html.parser": _parse_html_parser,
+    "lxml": _parse_lxml,
+}
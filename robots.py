@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import atexit
+import urllib.request
+import urllib.robotparser
+from threading import Event, Lock, Thread
+from urllib.parse import urlparse
+
+from utils import get_logger
+
+
+def fetch_robots(robots_url, timeout):
+    # robots.txt lines; raises on any network or HTTP error.
+    with urllib.request.urlopen(robots_url, timeout=timeout) as response:
+        return response.read().decode('utf-8').splitlines()
+
+
+class RobotParserCache:
+    ''' Thread-safe robots.txt cache.
+
+    Each host's robots.txt is fetched by one thread at a time; other threads
+    asking for the same host wait for that fetch, or use the expired entry
+    while it is being refreshed. Entries expire after ttl seconds. A failed
+    fetch is cached as "allow everything" for negative_ttl seconds. The
+    cache is reloaded from snapshot_file at startup. Once start_saving is
+    called, a background thread writes it back every save_interval seconds
+    if it changed, and a last time at exit. '''
+
+    def __init__(self, timeout=5, ttl=86400, negative_ttl=3600,
+                 snapshot_file=None, fetch=fetch_robots, save_interval=60):
+        self.logger = get_logger("ROBOTS")
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.snapshot_file = snapshot_file
+        self.fetch = fetch
+        self.save_interval = save_interval
+
+        self.lock = Lock()
+        self.save_lock = Lock()
+        # Whether the cache changed since the last save
+        self.dirty = False
+        self.saver = None
+        # base_url -> (RobotFileParser or None, expiry time, robots.txt lines or None)
+        self.cache = {}
+        # base_url -> Event set when the fetch in progress finishes
+        self.in_flight = {}
+
+    def robots_allowed(self, url, user_agent="CS121Crawler"):
+        # Check robots.txt for url
+        rp = self._get(url)
+        if rp:
+            return rp.can_fetch(user_agent, url)
+        return True
+
+    def crawl_delay(self, url, user_agent="CS121Crawler"):
+        # Crawl-delay for url's host, if its robots.txt has been fetched
+        parsed = urlparse(url)
+        entry = self.cache.get(f"{parsed.scheme}://{parsed.netloc}")
+        if entry and entry[0]:
+            return entry[0].crawl_delay(user_agent)
+        return None
+
+    def _get(self, url):
+        parsed = urlparse(url)
+        base_url = f"{parsed.scheme}://{parsed.netloc}"
+
+        with self.lock:
+            entry = self.cache.get(base_url)
+            if entry and entry[1] > time.time():
+                return entry[0]
+            done = self.in_flight.get(base_url)
+            if done is None:
+                done = self.in_flight[base_url] = Event()
+                fetching = True
+            else:
+                fetching = False
+
+        if not fetching:
+            if entry:
+                # Being refreshed, the expired entry will do meanwhile.
+                return entry[0]
+            done.wait(self.timeout + 1)
+            entry = self.cache.get(base_url)
+            return entry[0] if entry else None
+
+        try:
+            entry = self._fetch(base_url)
+        finally:
+            with self.lock:
+                if entry:
+                    self.cache[base_url] = entry
+                    self.dirty = True
+                del self.in_flight[base_url]
+            done.set()
+        return entry[0]
+
+    def _fetch(self, base_url):
+        robots_url = f"{base_url}/robots.txt"
+        try:
+            lines = self.fetch(robots_url, self.timeout)
+        except Exception as e:
+            self.logger.info(f"Error checking robots.txt in {base_url}: {e}")
+            return (None, time.time() + self.negative_ttl, None)
+        return (self._parse(robots_url, lines), time.time() + self.ttl, lines)
+
+    @staticmethod
+    def _parse(robots_url, lines):
+        rp = urllib.robotparser.RobotFileParser()
+        rp.set_url(robots_url)
+        rp.parse(lines)
+        return rp
+
+    def load(self):
+        if not self.snapshot_file or not os.path.exists(self.snapshot_file):
+            return
+        try:
+            with open(self.snapshot_file) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Could not load {self.snapshot_file}: {e}")
+            return
+
+        now = time.time()
+        with self.lock:
+            for base_url, (expires, lines) in snapshot.items():
+                if expires <= now:
+                    continue
+                rp = None if lines is None else self._parse(f"{base_url}/robots.txt", lines)
+                self.cache[base_url] = (rp, expires, lines)
+        self.logger.info(
+            f"Loaded {len(self.cache)} robots.txt entries from {self.snapshot_file}.")
+
+    def start_saving(self):
+        if not self.snapshot_file or self.saver is not None:
+            return
+        if self.save_interval > 0:
+            self.saver = Thread(target=self._save_loop, daemon=True)
+            self.saver.start()
+        atexit.register(self.save)
+
+    def _save_loop(self):
+        while True:
+            time.sleep(self.save_interval)
+            try:
+                self.save()
+            except Exception:
+                self.logger.exception(f"Could not write {self.snapshot_file}.")
+
+    def save(self):
+        # Atomic: write a temporary file, then rename it over the snapshot.
+        # Does nothing if the cache did not change.
+        if not self.snapshot_file:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            snapshot = {
+                base_url: (expires, lines)
+                for base_url, (_, expires, lines) in self.cache.items()}
+        with self.save_lock:
+            tmp_file = f"{self.snapshot_file}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_file, self.snapshot_file)
+
+
+robot_cache = RobotParserCache()
+
+def get_robot_cache():
+    return robot_cache
+
+def configure_robot_cache(config):
+    robot_cache.ttl = config.robots_ttl
+    robot_cache.snapshot_file = config.robots_file
+    robot_cache.save_interval = config.checkpoint_interval
+    robot_cache.load()
+    robot_cache.start_saving()
@@ -0,0 +1,109 @@
+''' Fixed-memory summaries for the bounded-memory statistics mode.
+
+HyperLogLog estimates the number of distinct strings (or 64-bit hashes)
+added; TopKCounter keeps approximate counts of the most frequent items.
+Both can be merged, so per-thread or per-process summaries add up to the
+summary of the whole crawl. '''
+import heapq
+import math
+from hashlib import blake2b
+from operator import itemgetter
+
+
+def hash64(item):
+    return int.from_bytes(
+        blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog(object):
+    ''' Distinct count estimate in 2 ** precision one-byte registers.
+
+    The standard error is 1.04 / sqrt(2 ** precision): about 0.8% for
+    precision 14 (16 KB) and 0.2% for precision 18 (256 KB). '''
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError(f"HyperLogLog precision must be 4-18, not {precision}.")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        # An int is taken to be a 64-bit hash already.
+        x = item if isinstance(item, int) else hash64(item)
+        bits = 64 - self.precision
+        index = x >> bits
+        # Position of the first 1 bit in the remaining bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs of different precision.")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class TopKCounter(object):
+    ''' Approximate counts of the most frequent items, in the spirit of
+    Space-Saving, tracking at most 2 * capacity items.
+
+    Updated in batches (like a Counter) and reduced Misra-Gries style: once
+    more than 2 * capacity items are tracked, the (capacity + 1)-th largest
+    count is subtracted from every count and the items left at zero are
+    dropped. The subtracted total is kept in `error`, so the true count of
+    an item lies in [count, count + error], and error <= N / (capacity + 1)
+    for N counted occurrences. Any item occurring more than N / (capacity + 1)
+    times is tracked. '''
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.counts = dict()
+        self.error = 0
+
+    def update(self, counts):
+        tracked = self.counts
+        for item, n in counts.items():
+            tracked[item] = tracked.get(item, 0) + n
+        if len(tracked) > 2 * self.capacity:
+            self._reduce()
+
+    def merge(self, other):
+        self.error += other.error
+        self.update(other.counts)
+
+    def _reduce(self):
+        largest = heapq.nlargest(
+            self.capacity + 1, self.counts.items(), key=itemgetter(1))
+        threshold = largest[-1][1]
+        self.error += threshold
+        self.counts = {
+            item: n - threshold for item, n in largest if n > threshold}
+
+    def most_common(self, n=None):
+        if n is None:
+            return sorted(self.counts.items(), key=itemgetter(1), reverse=True)
+        return heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+
+    def __len__(self):
+        return len(self.counts)
@@ -1,6 +1,50 @@
+import re
 import sys
+from collections import Counter
+
+# A token is a maximal run of alphanumeric characters and apostrophes,
+# lowercased. Two engines give the same output as tokenize_segmented:
+# ASCII text goes through a translate table and str.split, all in C.
+# Other text uses a compiled regex, where \w is alphanumeric plus '_',
+# so runs containing '_' are split on it afterwards.
+ASCII_TABLE = {
+    o: (chr(o) if chr(o).isalnum() or chr(o) == "'" else " ")
+    for o in range(128)}
+WORD_RUN = re.compile(r"[\w']+")
+
 
 def tokenize(text):
+    # Return token list
+    if text.isascii():
+        return text.translate(ASCII_TABLE).lower().split()
+    tokens = WORD_RUN.findall(text)
+    if "_" in text:
+        tokens = [part for token in tokens for part in token.split("_") if part]
+    return list(map(str.lower, tokens))
+
+
+def iter_tokens(text):
+    # Yield tokens one at a time, without building the token list
+    for match in WORD_RUN.finditer(text):
+        token = match.group().lower()
+        if "_" in token:
+            yield from filter(None, token.split("_"))
+        else:
+            yield token
+
+
+def tokenize_and_count(text):
+    # tokenize then computeWordFrequencies, returning (number of tokens,
+    # {token: count}). Still builds the token list: counting inside the
+    # tokenizing loop is slower, since split and Counter both run in C.
+    freq_map = Counter(tokenize(text))
+    return sum(freq_map.values()), freq_map
+
+
+def tokenize_segmented(text):
+    # Reference implementation: filters the text 1 KB at a time.
+    # Runs of over 1 KB without a delimiter are split at segment
+    # boundaries, otherwise the output is the same as tokenize.
     # tokens
     token_list = []
     buffer = ""
@@ -52,17 +96,9 @@ def tokenize(text):
 
 
 def computeWordFrequencies(token_list):
-    # Iterate through and count, sorting into map
-    freq_map: map[str, int] = {}
-    for token in token_list:
-        if token in freq_map:
-            # add to count
-            freq_map[token] += 1
-        else:
-            freq_map[token] = 1
-    return freq_map
+    # Count tokens into a map
+    return Counter(token_list)
 
 def tokenize_visible_text(text):
-    token_list = tokenize(text)
-    frequency_map = computeWordFrequencies(token_list)
+    _, frequency_map = tokenize_and_count(text)
     return frequency_map
\ No newline at end of file
@@ -0,0 +1,118 @@
+import re
+from collections import Counter, OrderedDict
+from threading import Lock
+from urllib.parse import urlparse
+
+# Static crawl rules for is_valid, each compiled into a single regex.
+# Every rule is (name, test), where test(parsed, path, query) is True if
+# the url must be rejected. path and query are lowercased.
+
+ALLOWED_DOMAINS = re.compile(
+    r"(?:ics\.uci\.edu|cs\.uci\.edu|informatics\.uci\.edu|stat\.uci\.edu)$")
+
+# Login pages
+LOGIN = re.compile(r"login|sign_in|signin|log_in|auth")
+
+# Calendar pages
+CALENDAR = re.compile(r"/(?:calendar|events?)/|/\d{4}/\d{1,2}/\d{1,2}/")
+
+# Dynamic URL patterns
+DYNAMIC_QUERY = re.compile(
+    r"cfid=|cid=|sessionid=|session=|ssid=|ref=|replytocom=|utm_|fbclid=|"
+    r"gclid=|sid=|view=|sort=|order=|page=|filter=|cftoken=|jsessionid=")
+
+# Bad url types
+BAD_PATH = re.compile(
+    r"/cgi-bin/|/wp-admin/|/wp-content/|/administrator/|/phpmyadmin/|"
+    r"server-status|/.git/|/.svn/|/.env")
+
+# File extensions
+EXTENSION = re.compile(
+    r"\.(?:css|js|bmp|gif|jpe?g|ico"
+    r"|png|tiff?|mid|mp2|mp3|mp4"
+    r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+    r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+    r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+    r"|epub|dll|cnf|tgz|sha1"
+    r"|thmx|mso|arff|rtf|jar|csv"
+    r"|rm|smil|wmv|swf|wma|zip|rar|gz)$")
+
+# Too many parameters: more than 10
+MAX_QUERY_PARAMS = 10
+
+RULES = [
+    ("scheme", lambda parsed, path, query: parsed.scheme not in ("http", "https")),
+    ("domain", lambda parsed, path, query: not ALLOWED_DOMAINS.search(parsed.netloc.lower())),
+    ("login", lambda parsed, path, query: LOGIN.search(path)),
+    ("calendar", lambda parsed, path, query: CALENDAR.search(path)),
+    ("dynamic_query", lambda parsed, path, query: DYNAMIC_QUERY.search(query)),
+    ("bad_path", lambda parsed, path, query: BAD_PATH.search(path)),
+    ("too_many_params", lambda parsed, path, query: query.count("&") >= MAX_QUERY_PARAMS),
+    ("extension", lambda parsed, path, query: EXTENSION.search(path)),
+]
+
+
+class UrlFilter(object):
+    ''' Applies RULES to normalized urls.
+
+    Decisions are kept in a bounded LRU cache keyed by the normalized url.
+    rejections counts, per rule, how many urls it rejected (cached
+    decisions included), to show which trap rules fire most. '''
+
+    def __init__(self, cache_size=65536):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = Lock()
+        self.rejections = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def rejecting_rule(self, url):
+        # Name of the first rule rejecting the normalized url, or None.
+        with self.lock:
+            if url in self.cache:
+                self.cache.move_to_end(url)
+                self.cache_hits += 1
+                rule = self.cache[url]
+                if rule:
+                    self.rejections[rule] += 1
+                return rule
+
+        parsed = urlparse(url)
+        path = parsed.path.lower()
+        query = parsed.query.lower()
+        rule = None
+        for name, test in RULES:
+            if test(parsed, path, query):
+                rule = name
+                break
+
+        with self.lock:
+            self.cache_misses += 1
+            self.cache[url] = rule
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            if rule:
+                self.rejections[rule] += 1
+        return rule
+
+    def count_rejection(self, rule):
+        # For checks made outside the static rules, e.g. robots.txt.
+        with self.lock:
+            self.rejections[rule] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.cache_hits + self.cache_misses
+            hit_rate = self.cache_hits / lookups if lookups else 0.0
+            rejections = ", ".join(
+                f"{rule} {count}" for rule, count in self.rejections.most_common())
+        return (
+            f"decision cache hit rate {hit_rate:.1%}, "
+            f"rejections: {rejections or 'none'}")
+
+
+url_filter = UrlFilter()
+
+def get_url_filter():
+    return url_filter
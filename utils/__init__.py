@@ -1,35 +1,106 @@
 import os
+import atexit
 import logging
-from hashlib import sha256
-from urllib.parse import urlparse
+import random
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+
+# Loggers only put their records on log_queue. One background thread
+# formats them and writes them to the console and to Logs/<file>.log, so
+# worker threads never wait for I/O.
+# Per-url messages are logged with extra=SAMPLED, and only a random
+# sample_rate fraction of them is kept (configure_logging).
+SAMPLED = {"sampled": True}
+
+log_queue = SimpleQueue()
+log_lock = Lock()
+log_listener = None
+sample_rate = 1.0
+
+
+class LogFiles(logging.Handler):
+    ''' Writes each record to the log file of its logger, opening every file
+    once however many loggers share it. Only used by the listener thread. '''
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.files = {}
+
+    def emit(self, record):
+        handler = self.files.get(record.log_file)
+        if handler is None:
+            handler = logging.FileHandler(f"Logs/{record.log_file}.log")
+            handler.setFormatter(self.formatter)
+            self.files[record.log_file] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        super().close()
+
+
+class LogQueueHandler(QueueHandler):
+    def __init__(self, log_file):
+        super().__init__(log_queue)
+        self.log_file = log_file
+
+    def prepare(self, record):
+        # Unlike QueueHandler, leaves formatting to the listener thread.
+        # Our messages are f-strings, so there are no arguments that could
+        # change before then.
+        record.log_file = self.log_file
+        return record
+
+
+def sample(record):
+    return (
+        sample_rate >= 1 or not getattr(record, "sampled", False)
+        or random.random() < sample_rate)
+
 
 def get_logger(name, filename=None):
+    # Sets the logger up on the first call for name; later calls return it
+    # unchanged instead of adding more handlers.
+    global log_listener
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    with log_lock:
+        if log_listener is None:
+            formatter = logging.Formatter(
+               "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+            ch = logging.StreamHandler()
+            ch.setLevel(logging.INFO)
+            ch.setFormatter(formatter)
+            files = LogFiles()
+            files.setFormatter(formatter)
+            log_listener = QueueListener(
+                log_queue, ch, files, respect_handler_level=True)
+            log_listener.start()
+            atexit.register(stop_logging)
+        if any(isinstance(handler, LogQueueHandler) for handler in logger.handlers):
+            return logger
+        logger.setLevel(logging.INFO)
+        if not os.path.exists("Logs"):
+            os.makedirs("Logs")
+        logger.addHandler(LogQueueHandler(filename if filename else name))
+        logger.addFilter(sample)
     return logger
 
 
-def get_urlhash(url):
-    parsed = urlparse(url)
-    # everything other than scheme.
-    return sha256(
-        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
-        f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
+def configure_logging(config):
+    global sample_rate
+    if not 0 < config.log_sample_rate <= 1:
+        raise ValueError(
+            f"LOGSAMPLERATE must be in (0, 1], not {config.log_sample_rate}.")
+    sample_rate = config.log_sample_rate
+
 
-def normalize(url):
-    if url.endswith("/"):
-        return url.rstrip("/")
-    return url
+def stop_logging():
+    # Writes out the records still queued and stops the listener thread.
+    # Also runs at exit.
+    global log_listener
+    with log_lock:
+        if log_listener is not None:
+            log_listener.stop()
+            log_listener = None
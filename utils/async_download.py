@@ -0,0 +1,135 @@
+import asyncio
+import time
+from urllib.parse import urlencode
+
+from utils.download import backoff_delay, to_response, failed_response, replay
+from utils.pagestore import get_page_store
+
+# Retried with backoff, like utils.download: 5xx answers and these errors.
+RETRY_ERRORS = (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError)
+
+
+class HTTPError(ConnectionError):
+    pass
+
+
+class AsyncCacheClient(object):
+    ''' Minimal asyncio HTTP/1.1 client for the cache server.
+
+    Connections are kept alive and reused, up to max_connections open at
+    once. Timeouts, retries and backoff follow the same config options as
+    utils.download.download. '''
+
+    def __init__(self, config, max_connections=1000):
+        self.config = config
+        self.store = get_page_store(config)
+        if config.page_store_mode != "replay":
+            # Replay never contacts the cache server, which is then None.
+            self.host, self.port = config.cache_server
+        self.idle = []
+        self.slots = asyncio.Semaphore(max_connections)
+
+    async def download(self, url, logger=None):
+        config = self.config
+        if self.store is not None and config.page_store_mode == "replay":
+            return replay(url, self.store, logger)
+        start = time.perf_counter()
+        for attempt in range(config.download_retries + 1):
+            try:
+                status, content = await self._get(url)
+            except RETRY_ERRORS as e:
+                if attempt == config.download_retries:
+                    return failed_response(
+                        url, e, time.perf_counter() - start, logger)
+                await asyncio.sleep(backoff_delay(config, attempt))
+                continue
+            if status < 500 or attempt == config.download_retries:
+                break
+            await asyncio.sleep(backoff_delay(config, attempt))
+        latency = time.perf_counter() - start
+        if self.store is not None:
+            self.store.put(url, status, content)
+        return to_response(url, status, content, latency, logger)
+
+    async def _get(self, url):
+        query = urlencode([("q", f"{url}"), ("u", f"{self.config.user_agent}")])
+        request = (
+            f"GET /?{query} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            f"Connection: keep-alive\r\n\r\n").encode("ascii")
+
+        async with self.slots:
+            if self.idle:
+                try:
+                    return await self._exchange(*self.idle.pop(), request)
+                except RETRY_ERRORS:
+                    # The server may have closed the idle connection.
+                    pass
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port),
+                self.config.connect_timeout)
+            return await self._exchange(reader, writer, request)
+
+    async def _exchange(self, reader, writer, request):
+        try:
+            writer.write(request)
+            await writer.drain()
+            status, content, keep_alive = await asyncio.wait_for(
+                self._read_response(reader), self.config.read_timeout)
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, content
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise HTTPError("Connection closed by the cache server.")
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+            raise HTTPError(f"Malformed status line {status_line!r}.")
+        status = int(parts[1])
+        keep_alive = parts[0] == b"HTTP/1.1"
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        if connection == "close":
+            keep_alive = False
+        elif connection == "keep-alive":
+            keep_alive = True
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Trailers up to the empty line
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            content = b"".join(chunks)
+        elif "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        else:
+            content = await reader.read()
+            keep_alive = False
+        return status, content, keep_alive
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
@@ -8,12 +8,47 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.engine = config["LOCAL PROPERTIES"].get("ENGINE", "threads").strip()
+        self.max_in_flight = int(config["LOCAL PROPERTIES"].get("MAXINFLIGHT", "1000"))
+        self.processes = int(config["LOCAL PROPERTIES"].get("PROCESSES", "1"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.store = config["LOCAL PROPERTIES"].get("STORE", "sqlite").strip()
+        self.commit_interval = float(config["LOCAL PROPERTIES"].get("COMMITINTERVAL", "1.0"))
+        self.lazy_resume = config["LOCAL PROPERTIES"].getboolean("LAZYRESUME", fallback=False)
+        self.revalidate = config["LOCAL PROPERTIES"].getboolean("REVALIDATE", fallback=False)
+        self.robots_file = config["LOCAL PROPERTIES"].get("ROBOTSSAVE", "robots.json").strip()
+        self.seen_filter = config["LOCAL PROPERTIES"].get("SEENFILTER", "exact").strip()
+        self.bloom_error_rate = float(config["LOCAL PROPERTIES"].get("BLOOMERRORRATE", "0.001"))
+        self.bloom_memory = float(config["LOCAL PROPERTIES"].get("BLOOMMEMORY", "64"))
+        self.stats_mode = config["LOCAL PROPERTIES"].get("STATS", "exact").strip()
+        self.stats_memory = float(config["LOCAL PROPERTIES"].get("STATSMEMORY", "16"))
+        self.stats_file = config["LOCAL PROPERTIES"].get("STATSSAVE", "stats.checkpoint").strip()
+        self.checkpoint_interval = float(config["LOCAL PROPERTIES"].get("CHECKPOINTINTERVAL", "60"))
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICSPORT", "0"))
+        self.metrics_interval = float(config["LOCAL PROPERTIES"].get("METRICSINTERVAL", "60"))
+        self.page_store_mode = config["LOCAL PROPERTIES"].get("PAGESTOREMODE", "off").strip()
+        self.page_store = config["LOCAL PROPERTIES"].get("PAGESTORE", "pages.store").strip()
+        self.log_sample_rate = float(config["LOCAL PROPERTIES"].get("LOGSAMPLERATE", "1"))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = float(config["CONNECTION"].get("CONNECTTIMEOUT", "5"))
+        self.read_timeout = float(config["CONNECTION"].get("READTIMEOUT", "30"))
+        self.download_retries = int(config["CONNECTION"].get("RETRIES", "3"))
+        self.download_backoff = float(config["CONNECTION"].get("BACKOFF", "0.5"))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.parser = config["CRAWLER"].get("PARSER", "stream").strip()
+        self.robots_ttl = float(config["CRAWLER"].get("ROBOTSTTL", "86400"))
+        self.max_pages = int(config["CRAWLER"].get("MAXPAGES", "0"))
+        self.max_time = float(config["CRAWLER"].get("MAXTIME", "0"))
+        self.host_budget = int(config["CRAWLER"].get("HOSTBUDGET", "100"))
+        self.host_budget_per_page = float(config["CRAWLER"].get("HOSTBUDGETPERPAGE", "10"))
+        self.max_page_size = float(config["CRAWLER"].get("MAXPAGESIZE", "10"))
+        self.near_dup_threshold = float(config["CRAWLER"].get("NEARDUPTHRESHOLD", "0.85"))
+        self.content_types = [
+            content_type.strip().lower() for content_type in config["CRAWLER"].get(
+                "CONTENTTYPES", "text/html,application/xhtml+xml,text/plain").split(",")]
 
         self.cache_server = None
\ No newline at end of file
@@ -1,21 +1,101 @@
 import requests
 import cbor
 import time
+import random
+import threading
+
+from requests.adapters import HTTPAdapter
 
 from utils.response import Response
+from utils.pagestore import get_page_store
+
+# One keep-alive session, and so one connection pool, per worker thread.
+_local = threading.local()
+
+# Retried with backoff: 5xx answers and connection failures. Any other
+# requests error fails the download at once.
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout)
+MAX_BACKOFF = 30
+
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        _local.session = session
+    return session
+
+
+def backoff_delay(config, attempt):
+    # Exponential backoff with full jitter.
+    return random.uniform(
+        0, min(MAX_BACKOFF, config.download_backoff * 2 ** attempt))
+
 
 def download(url, config, logger=None):
+    store = get_page_store(config)
+    if store is not None and config.page_store_mode == "replay":
+        return replay(url, store, logger)
     host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    session = get_session()
+    start = time.perf_counter()
+    resp = None
+    for attempt in range(config.download_retries + 1):
+        try:
+            resp = session.get(
+                f"http://{host}:{port}/",
+                params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+                timeout=(config.connect_timeout, config.read_timeout))
+        except RETRY_ERRORS as e:
+            if attempt == config.download_retries:
+                return failed_response(
+                    url, e, time.perf_counter() - start, logger)
+            time.sleep(backoff_delay(config, attempt))
+            continue
+        except requests.RequestException as e:
+            # e.g. a broken chunked or compressed body: not retried.
+            return failed_response(url, e, time.perf_counter() - start, logger)
+        if resp.status_code < 500 or attempt == config.download_retries:
+            break
+        time.sleep(backoff_delay(config, attempt))
+    latency = time.perf_counter() - start
+    if store is not None:
+        store.put(url, resp.status_code, resp.content)
+    return to_response(url, resp.status_code, resp.content, latency, logger)
+
+
+def replay(url, store, logger=None):
+    # The answer recorded for url, instead of downloading it.
+    start = time.perf_counter()
+    recorded = store.get(url)
+    if recorded is None:
+        return failed_response(
+            url, "not in the page store", time.perf_counter() - start, logger)
+    status_code, content = recorded
+    return to_response(url, status_code, content, time.perf_counter() - start, logger)
+
+
+def to_response(url, status_code, content, latency, logger=None):
+    # Decode the cache server's answer (CBOR) into a Response.
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if status_code < 400 and content:
+            return Response(cbor.loads(content), latency)
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(f"Spacetime Response error <Response [{status_code}]> with url {url}.")
+    return Response({
+        "error": f"Spacetime Response error <Response [{status_code}]> with url {url}.",
+        "status": status_code,
+        "url": url}, latency)
+
+
+def failed_response(url, error, latency, logger=None):
+    # The cache server could not be reached at all.
+    if logger:
+        logger.error(f"Download failed for url {url}: {error}")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
+        "error": f"Download failed for url {url}: {error}",
+        "status": None,
+        "url": url}, latency)
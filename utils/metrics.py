@@ -0,0 +1,252 @@
+''' In-process crawler metrics: counters, latency histograms and gauges.
+
+Metrics are exposed as Prometheus text on http://localhost:<METRICSPORT>/metrics
+and summarized in the log every METRICSINTERVAL seconds. Recording a value
+costs one uncontended lock and, for histograms, a bisect. '''
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+
+from utils import get_logger
+
+# Upper bounds in seconds, from fast in-memory steps to slow downloads
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(label, value):
+    if label is None:
+        return ""
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'{{{label}="{value}"}}'
+
+
+class Counter(object):
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.lock = Lock()
+        self.values = {}
+
+    def inc(self, label_value=None, amount=1):
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+    def render(self):
+        with self.lock:
+            values = sorted(self.values.items(), key=lambda item: str(item[0]))
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_value, value in values:
+            lines.append(f"{self.name}{_labels(self.label, label_value)} {value}")
+        return lines
+
+
+class Gauge(object):
+    ''' Read on demand from function, which returns a number, or a dict of
+    label value to number. '''
+
+    def __init__(self, name, help, function, label=None):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.label = label
+
+    def render(self):
+        value = self.function()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if isinstance(value, dict):
+            for label_value in sorted(value):
+                lines.append(
+                    f"{self.name}{_labels(self.label, label_value)} {value[label_value]}")
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Histogram(object):
+    def __init__(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.lock = Lock()
+        # label value -> [count per bucket (+Inf last), sum, count]
+        self.values = {}
+
+    def observe(self, value, label_value=None):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_value)
+            if entry is None:
+                entry = self.values[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, label_value=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, label_value)
+
+    def totals(self):
+        # label value -> (sum, count)
+        with self.lock:
+            return {
+                label_value: (entry[1], entry[2])
+                for label_value, entry in self.values.items()}
+
+    def render(self):
+        with self.lock:
+            values = sorted(
+                ((label_value, (list(entry[0]), entry[1], entry[2]))
+                 for label_value, entry in self.values.items()),
+                key=lambda item: str(item[0]))
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total, count) in values:
+            prefix = "" if self.label is None else (
+                _labels(self.label, label_value)[1:-1] + ",")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{_labels(self.label, label_value)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label, label_value)} {count}")
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self.lock = Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        # A metric registered again under the same name replaces the old one.
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "crawler_stage_seconds", "Time spent in each step of processing a url.", "stage"))
+PAGES = registry.register(Counter(
+    "crawler_pages_total", "Downloaded urls by outcome.", "outcome"))
+NEW_LINKS = registry.register(Histogram(
+    "crawler_new_links_per_page", "Links of a page that were new to the frontier.",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500)))
+
+
+def time_stage(stage):
+    return STAGE_SECONDS.time(stage)
+
+
+def register_gauge(name, help, function, label=None):
+    return registry.register(Gauge(name, help, function, label))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsReporter(object):
+    ''' Logs a summary of the metrics every interval seconds: pages per
+    second and mean time per stage since the previous summary, and the
+    gauges. '''
+
+    def __init__(self, interval, logger):
+        self.interval = interval
+        self.logger = logger
+        self.last_time = time.perf_counter()
+        self.last_pages = PAGES.total()
+        self.last_stages = STAGE_SECONDS.totals()
+        self.pages_per_second = 0.0
+        register_gauge(
+            "crawler_pages_per_second",
+            "Downloaded urls per second over the last summary interval.",
+            lambda: self.pages_per_second)
+
+    def start(self):
+        Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.logger.info(self.summary())
+            except Exception:
+                self.logger.exception("Could not summarize metrics.")
+
+    def summary(self):
+        now = time.perf_counter()
+        pages = PAGES.total()
+        stages = STAGE_SECONDS.totals()
+        self.pages_per_second = (pages - self.last_pages) / (now - self.last_time)
+
+        means = []
+        for stage, (total, count) in sorted(stages.items()):
+            last_total, last_count = self.last_stages.get(stage, (0.0, 0))
+            if count > last_count:
+                mean = (total - last_total) / (count - last_count)
+                means.append(f"{stage} {mean * 1000:.1f}ms")
+        gauges = []
+        with registry.lock:
+            metrics = list(registry.metrics.values())
+        for metric in metrics:
+            if isinstance(metric, Gauge) and metric.label is None:
+                gauges.append(f"{metric.name}={metric.function():g}")
+
+        self.last_time, self.last_pages, self.last_stages = now, pages, stages
+        return (
+            f"{pages} urls, {self.pages_per_second:.1f}/s; "
+            f"mean per stage: {', '.join(means) or 'none'}; {', '.join(gauges)}.")
+
+
+metrics_server = None
+metrics_reporter = None
+
+def start_metrics(config):
+    # Starts the metrics server and summary log, once per process.
+    global metrics_server, metrics_reporter
+    logger = get_logger("METRICS")
+    if config.metrics_port and metrics_server is None:
+        metrics_server = ThreadingHTTPServer(
+            ("127.0.0.1", config.metrics_port), MetricsHandler)
+        metrics_server.daemon_threads = True
+        Thread(target=metrics_server.serve_forever, daemon=True).start()
+        logger.info(
+            f"Serving metrics on http://127.0.0.1:{config.metrics_port}/metrics.")
+    if config.metrics_interval > 0 and metrics_reporter is None:
+        metrics_reporter = MetricsReporter(config.metrics_interval, logger)
+        metrics_reporter.start()
@@ -0,0 +1,172 @@
+''' Append-only on-disk store of downloaded pages, for record and replay.
+
+In record mode, utils.download appends every cache server answer (url,
+status, body) to the store. In replay mode, it serves downloads from the
+store and never touches the network, so filter, parser and tokenizer
+experiments can rerun a crawl at disk speed.
+
+A store is a directory of segment files, each a sequence of records:
+
+    header (PageStore.HEADER) | url (utf-8) | body (zlib compressed)
+
+and an index file of fixed-size (url hash, segment, offset) entries, which
+is loaded at open. Segments are read through mmap. Records are never
+rewritten; recording a url again makes the newest record win. Every
+record is flushed as it is written; one torn by a crash fails its checksum
+and reads as not recorded. '''
+import atexit
+import mmap
+import os
+import struct
+import zlib
+from hashlib import blake2b
+from threading import Lock
+
+MAGIC = b"PGS1"
+
+
+def url_key(url):
+    return int.from_bytes(blake2b(url.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class PageStore(object):
+    # magic, url length, status (-1 if none), body length, crc32 of the body
+    HEADER = struct.Struct("<4sIiII")
+    # url key, segment number, record offset
+    INDEX_ENTRY = struct.Struct("<QIQ")
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024, compress_level=6):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compress_level = compress_level
+        self.lock = Lock()
+        # url key -> (segment, offset)
+        self.index = {}
+        self.maps = {}
+        os.makedirs(directory, exist_ok=True)
+
+        index_file = os.path.join(directory, "index.dat")
+        if os.path.exists(index_file):
+            with open(index_file, "rb") as f:
+                data = f.read()
+            # A torn last entry is dropped.
+            usable = len(data) - len(data) % self.INDEX_ENTRY.size
+            for key, segment, offset in self.INDEX_ENTRY.iter_unpack(data[:usable]):
+                self.index[key] = (segment, offset)
+        self.index_file = open(index_file, "ab")
+
+        segments = sorted(
+            int(name[len("segment-"):-len(".dat")])
+            for name in os.listdir(directory)
+            if name.startswith("segment-") and name.endswith(".dat"))
+        self.segment = segments[-1] if segments else 0
+        self.writer = None
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:05d}.dat")
+
+    def _map(self, segment, end):
+        # mmap of segment covering at least end bytes, remapped as it grows.
+        mapped = self.maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            with self.lock:
+                mapped = self.maps.get(segment)
+                if mapped is None or len(mapped) < end:
+                    if self.writer is not None and segment == self.segment:
+                        self.writer.flush()
+                    with open(self._segment_path(segment), "rb") as f:
+                        if not os.fstat(f.fileno()).st_size:
+                            # mmap cannot map an empty file
+                            return b""
+                        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.maps[segment] = mapped
+        return mapped
+
+    def _read(self, segment, offset):
+        # (url, status, body) of the record at offset, None if torn.
+        mapped = self._map(segment, offset + self.HEADER.size)
+        if len(mapped) < offset + self.HEADER.size:
+            return None
+        magic, url_length, status, body_length, crc = self.HEADER.unpack_from(mapped, offset)
+        start = offset + self.HEADER.size
+        end = start + url_length + body_length
+        if magic != MAGIC:
+            return None
+        mapped = self._map(segment, end)
+        if len(mapped) < end:
+            return None
+        body = mapped[start + url_length:end]
+        if zlib.crc32(body) != crc:
+            return None
+        url = mapped[start:start + url_length].decode("utf-8")
+        return url, (None if status < 0 else status), zlib.decompress(body)
+
+    def get(self, url):
+        # (status, body) recorded for url, None if it was not recorded.
+        location = self.index.get(url_key(url))
+        if location is None:
+            return None
+        record = self._read(*location)
+        if record is None or record[0] != url:
+            return None
+        return record[1], record[2]
+
+    def put(self, url, status, content):
+        url_bytes = url.encode("utf-8")
+        body = zlib.compress(content or b"", self.compress_level)
+        header = self.HEADER.pack(
+            MAGIC, len(url_bytes), -1 if status is None else status,
+            len(body), zlib.crc32(body))
+        with self.lock:
+            if self.writer is None or self.writer.tell() >= self.segment_size:
+                self._next_segment()
+            offset = self.writer.tell()
+            self.writer.write(header + url_bytes + body)
+            self.index_file.write(self.INDEX_ENTRY.pack(url_key(url), self.segment, offset))
+            self.writer.flush()
+            self.index_file.flush()
+            self.index[url_key(url)] = (self.segment, offset)
+
+    def _next_segment(self):
+        # The first write of a session opens the last segment if it has room.
+        if self.writer is not None:
+            self.writer.close()
+            self.segment += 1
+        elif os.path.exists(self._segment_path(self.segment)) and (
+                os.path.getsize(self._segment_path(self.segment)) >= self.segment_size):
+            self.segment += 1
+        self.writer = open(self._segment_path(self.segment), "ab")
+
+    def __contains__(self, url):
+        return url_key(url) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+            self.index_file.close()
+            for mapped in self.maps.values():
+                mapped.close()
+            self.maps = {}
+
+
+page_stores = {}
+page_stores_lock = Lock()
+
+def get_page_store(config):
+    # The store of config.page_store, opened once per process, or None if
+    # PAGESTOREMODE is off.
+    if config.page_store_mode == "off":
+        return None
+    if config.page_store_mode not in ("record", "replay"):
+        raise ValueError(f"Unknown PAGESTOREMODE {config.page_store_mode!r}.")
+    with page_stores_lock:
+        store = page_stores.get(config.page_store)
+        if store is None:
+            store = page_stores[config.page_store] = PageStore(config.page_store)
+            atexit.register(store.close)
+        return store
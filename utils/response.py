@@ -1,14 +1,29 @@
 import pickle
 
 class Response(object):
-    def __init__(self, resp_dict):
+    def __init__(self, resp_dict, latency=None):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        # Seconds spent downloading, retries included
+        self.latency = latency
+        # The pickled requests.Response, unpickled on first use of
+        # raw_response: error pages and gated pages are never unpickled.
+        self._payload = resp_dict["response"] if "response" in resp_dict else None
+        self.payload_size = len(self._payload) if isinstance(self._payload, bytes) else 0
+        self._raw_response = None
+        self._decoded = False
+
+    @property
+    def raw_response(self):
+        if not self._decoded:
+            try:
+                self._raw_response = (
+                    pickle.loads(self._payload)
+                    if self._payload is not None else
+                    None)
+            except (TypeError, ValueError, EOFError, pickle.UnpicklingError):
+                self._raw_response = None
+            self._payload = None
+            self._decoded = True
+        return self._raw_response
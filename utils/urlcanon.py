@@ -0,0 +1,59 @@
+''' The one notion of url identity used by the scraper, frontier and stats.
+
+canonicalize maps aliases of a url to one string:
+    - scheme and host are lowercased, and the default port is dropped
+    - the fragment is dropped
+    - a trailing slash is dropped from the path, which is "/" if empty
+    - empty query parameters are dropped and the rest are sorted
+
+url_fingerprint is a 64-bit integer of the canonical url without its
+scheme, so http and https aliases are one url. Frontier save files, the
+seen filter and the unique url statistics are keyed by it. Both are
+memoized, and urls that are already canonical skip the parse. '''
+import re
+from functools import lru_cache
+from hashlib import blake2b
+from urllib.parse import urlsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Already canonical: lowercase http(s) host without port or user info, no
+# query or fragment, and a path that is "/" or does not end with one.
+CANONICAL = re.compile(r"https?://[a-z0-9.-]+/(?:[^?#]*[^/?#])?")
+
+# Entries per memo; links repeat a lot within a host.
+CACHE_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def canonicalize(url):
+    # Raises ValueError for a malformed url, e.g. a non-numeric port.
+    if CANONICAL.fullmatch(url):
+        return url
+    parsed = urlsplit(url)
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    port = parsed.port
+    if port is not None and port == DEFAULT_PORTS.get(scheme):
+        netloc = netloc.rsplit(":", 1)[0]
+
+    path = parsed.path.rstrip("/") or "/"
+    params = sorted(param for param in parsed.query.split("&") if param)
+    if params:
+        return f"{scheme}://{netloc}{path}?{'&'.join(params)}"
+    return f"{scheme}://{netloc}{path}"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def url_fingerprint(url):
+    canonical = canonicalize(url)
+    # Everything other than the scheme
+    rest = canonical[canonical.find("://") + 3:]
+    return int.from_bytes(blake2b(rest.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def cache_stats():
+    info = canonicalize.cache_info()
+    lookups = info.hits + info.misses
+    hit_rate = info.hits / lookups if lookups else 0.0
+    return f"canonical url cache hit rate {hit_rate:.1%} of {lookups} lookups"